@@ -11,23 +11,52 @@ Usage:
 
 import asyncio
 import os
+import re
 import sys
 import argparse
+import random
+import threading
 from pathlib import Path
 from datetime import datetime
 
 # Add the src directory to the Python path
 src_path = Path(__file__).parent / "src"
-sys.path.insert(0, str(src_path))
+if str(src_path) not in sys.path:
+    sys.path.insert(0, str(src_path))
 
+import httpx
 from dotenv import load_dotenv
-from open_deep_research.deep_researcher import design_doc_agent
 
-# Load environment variables
-load_dotenv()
+# Analysis units are I/O bound on LLM and GitHub calls, so run several in parallel by default.
+# Configuration.max_concurrent_analysis_units accepts up to 20.
+MAX_CONCURRENT_LIMIT = 20
+DEFAULT_MAX_CONCURRENT = min(8, (os.cpu_count() or 1) * 2)
 
-def parse_arguments():
-    """Parse command line arguments"""
+LLM_CACHE_BACKENDS = ("sqlite", "redis", "off")
+
+def configure_llm_cache():
+    """Install a global LLM response cache selected by ODR_LLM_CACHE (sqlite|redis|off)"""
+    backend = os.getenv("ODR_LLM_CACHE", "sqlite").strip().lower()
+    if backend not in LLM_CACHE_BACKENDS:
+        raise ValueError(f"ODR_LLM_CACHE must be one of {', '.join(LLM_CACHE_BACKENDS)}, got {backend!r}")
+    if backend == "off":
+        return
+
+    from langchain_core.globals import set_llm_cache
+
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("ODR_LLM_CACHE=redis needs the `redis` extra: uv pip install -r pyproject.toml --extra redis") from e
+        from langchain_community.cache import RedisCache
+        set_llm_cache(RedisCache(redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))))
+    else:
+        from langchain_community.cache import SQLiteCache
+        set_llm_cache(SQLiteCache(database_path=os.getenv("ODR_LLM_CACHE_PATH", ".odr_llm_cache.db")))
+
+def _build_parser() -> argparse.ArgumentParser:
+    """Build the command line argument parser"""
     parser = argparse.ArgumentParser(
         description="Run deep research analysis on any GitHub repository",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -52,7 +81,19 @@ Examples:
     parser.add_argument(
         "--model",
         default="gpt-4.1-mini",
-        help="OpenAI model to use (default: gpt-4.1-mini)"
+        help="OpenAI model used for repository analysis (default: gpt-4.1-mini)"
+    )
+    
+    parser.add_argument(
+        "--compression-model",
+        default="gpt-4.1-mini",
+        help="Smaller model used to compress sub-agent findings (default: gpt-4.1-mini)"
+    )
+    
+    parser.add_argument(
+        "--final-model",
+        default="gpt-4.1",
+        help="Model used to write the final design document (default: gpt-4.1)"
     )
     
     parser.add_argument(
@@ -72,8 +113,8 @@ Examples:
     parser.add_argument(
         "--max-concurrent",
         type=int,
-        default=1,
-        help="Maximum concurrent analysis units (default: 1)"
+        default=DEFAULT_MAX_CONCURRENT,
+        help=f"Maximum concurrent analysis units, up to {MAX_CONCURRENT_LIMIT} (default: {DEFAULT_MAX_CONCURRENT})"
     )
     
     parser.add_argument(
@@ -81,7 +122,35 @@ Examples:
         help="Output filename (default: auto-generated based on repo and timestamp)"
     )
     
-    return parser.parse_args()
+    return parser
+
+# Built once at import and reused by every parse_arguments() call
+_PARSER = _build_parser()
+
+def parse_arguments(argv=None):
+    """Parse command line arguments"""
+    return _PARSER.parse_args(argv)
+
+_FILENAME_UNSAFE = re.compile(r"[^a-z0-9 _-]+")
+
+def message_content(message) -> str:
+    """Extract the text content from a message object or message dict"""
+    if isinstance(message, dict):
+        return message["content"] if "content" in message else str(message)
+    content = getattr(message, "content", None)
+    return content if content is not None else str(message)
+
+def qualify_model_name(model: str) -> str:
+    """Prefix bare model names with the OpenAI provider, e.g. gpt-4.1 -> openai:gpt-4.1"""
+    return model if ":" in model else f"openai:{model}"
+
+def model_header_lines(args) -> list[str]:
+    """Markdown header lines naming the model configured for each pipeline stage"""
+    return [
+        f"**Analysis Model:** {qualify_model_name(args.model)}\n",
+        f"**Compression Model:** {qualify_model_name(args.compression_model)}\n",
+        f"**Final Document Model:** {qualify_model_name(args.final_model)}\n",
+    ]
 
 def generate_output_filename(repo_url: str, query: str) -> str:
     """Generate a filename based on repo and query"""
@@ -90,7 +159,7 @@ def generate_output_filename(repo_url: str, query: str) -> str:
     owner = repo_url.rstrip('/').split('/')[-2]
     
     # Clean query for filename
-    query_clean = "".join(c for c in query.lower() if c.isalnum() or c in (' ', '-', '_')).strip()
+    query_clean = _FILENAME_UNSAFE.sub("", query.lower()).strip()
     query_clean = query_clean.replace(' ', '_')[:50]  # Limit length
     
     # Add timestamp
@@ -98,7 +167,64 @@ def generate_output_filename(repo_url: str, query: str) -> str:
     
     return f"{owner}_{repo_name}_{query_clean}_{timestamp}.md"
 
-async def interactive_clarification_loop(args, config, filename, previous_content):
+# Provider rate limits and server hiccups are retried with backoff instead of failing the whole run
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429, 500, 502, 503, 504})
+RETRYABLE_ERROR_NAMES = frozenset({"APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError", "ServiceUnavailable", "ResourceExhausted"})
+MAX_RUN_ATTEMPTS = 6
+
+def is_transient_error(error: Exception) -> bool:
+    """Check whether an error is a rate limit or transient provider failure"""
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return (
+        status_code in RETRYABLE_STATUS_CODES
+        or type(error).__name__ in RETRYABLE_ERROR_NAMES
+        or isinstance(error, (httpx.TimeoutException, httpx.NetworkError))
+    )
+
+async def backoff(attempt: int, error: Exception):
+    """Sleep with exponential backoff and jitter before the next attempt"""
+    delay = min(30.0, 2.0 ** (attempt - 1)) + random.uniform(0, 1)
+    print(f"Transient error: {error}. Retrying in {delay:.1f}s (attempt {attempt + 1}/{MAX_RUN_ATTEMPTS})...")
+    await asyncio.sleep(delay)
+
+async def ainvoke_with_retries(payload, config):
+    """Invoke the design doc agent, retrying transient failures"""
+    from open_deep_research.deep_researcher import design_doc_agent
+
+    for attempt in range(1, MAX_RUN_ATTEMPTS + 1):
+        try:
+            return await design_doc_agent.ainvoke(payload, config=config)
+        except Exception as e:
+            if attempt == MAX_RUN_ATTEMPTS or not is_transient_error(e):
+                raise
+            await backoff(attempt, e)
+
+async def ainput(prompt: str) -> str:
+    """
+    Read a line from stdin on a daemon thread so the event loop keeps running
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(setter, value):
+        if not future.done():
+            setter(value)
+
+    def read_line():
+        try:
+            line = input(prompt)
+        except BaseException as e:
+            loop.call_soon_threadsafe(settle, future.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(settle, future.set_result, line)
+
+    # A daemon thread (unlike asyncio.to_thread) never blocks interpreter shutdown on a pending input()
+    threading.Thread(target=read_line, daemon=True).start()
+    return await future
+
+async def interactive_clarification_loop(args, config, filename, history):
     """
     Interactive loop for clarifications and regeneration
     """
@@ -110,12 +236,11 @@ async def interactive_clarification_loop(args, config, filename, previous_conten
     print()
     
     iteration = 1
-    current_content = previous_content
     
     while True:
         try:
             # Get user input
-            user_input = input("Your clarification/change request (or 'quit' to exit): ").strip()
+            user_input = (await ainput("Your clarification/change request (or 'quit' to exit): ")).strip()
             
             if user_input.lower() in ['quit', 'exit', 'q']:
                 print("Exiting clarification mode. Final analysis saved!")
@@ -130,34 +255,15 @@ async def interactive_clarification_loop(args, config, filename, previous_conten
             print("Regenerating analysis...")
             print()
             
-            # Create a follow-up query that includes the previous analysis and new request
-            follow_up_query = f"""
-Based on the previous analysis, please address this follow-up request:
-
-{user_input}
-
-Previous analysis context:
-{current_content[:2000]}...
-
-Please provide an updated analysis that addresses the new request while maintaining relevant context from the previous analysis.
-"""
-            
-            # Run the analysis again with the follow-up query
-            result = await design_doc_agent.ainvoke(
-                {"messages": [{"role": "user", "content": follow_up_query}]},
-                config=config
+            # Continue the existing conversation so the prior turns form a stable, cacheable prompt prefix
+            result = await ainvoke_with_retries(
+                {"messages": history + [{"role": "user", "content": user_input}]},
+                config
             )
+            history = result["messages"]
             
             # Extract the new content
-            final_message = result["messages"][-1]
-            if hasattr(final_message, 'content'):
-                new_content = final_message.content
-            elif isinstance(final_message, dict) and 'content' in final_message:
-                new_content = final_message['content']
-            else:
-                new_content = str(final_message)
-            
-            current_content = new_content
+            new_content = message_content(result["messages"][-1])
             
             print("Updated Analysis Generated!")
             print("=" * 50)
@@ -166,17 +272,19 @@ Please provide an updated analysis that addresses the new request while maintain
             base_filename = filename.rsplit('.', 1)[0]  # Remove .md extension
             updated_filename = f"{base_filename}_v{iteration + 1}.md"
             
-            # Save the updated analysis
-            with open(updated_filename, "w") as f:
-                f.write(f"# Deep Research Analysis (Updated)\n")
-                f.write(f"*Generated by Entelligence Deep Research*\n\n")
-                f.write(f"**Repository:** {args.repo_url}\n")
-                f.write(f"**Original Query:** {args.query}\n")
-                f.write(f"**Clarification #{iteration}:** {user_input}\n")
-                f.write(f"**Generated:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"**Model:** {args.model}\n\n")
-                f.write("---\n\n")
-                f.write(new_content)
+            # Save the updated analysis with a single write
+            parts = [
+                "# Deep Research Analysis (Updated)\n",
+                "*Generated by Entelligence Deep Research*\n\n",
+                f"**Repository:** {args.repo_url}\n",
+                f"**Original Query:** {args.query}\n",
+                f"**Clarification #{iteration}:** {user_input}\n",
+                f"**Generated:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n",
+                *model_header_lines(args),
+                "\n---\n\n",
+                new_content,
+            ]
+            Path(updated_filename).write_text("".join(parts), encoding="utf-8")
             
             print(f"Updated analysis saved to: {updated_filename}")
             
@@ -185,7 +293,7 @@ Please provide an updated analysis that addresses the new request while maintain
             
             iteration += 1
             
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, EOFError, asyncio.CancelledError):
             print("\n\nExiting clarification mode...")
             break
         except Exception as e:
@@ -200,7 +308,9 @@ async def run_deep_research(args):
     print("=" * 70)
     print(f"Query: {args.query}")
     print(f"Repository: {args.repo_url}")
-    print(f"Model: {args.model}")
+    print(f"Analysis model: {args.model}")
+    print(f"Compression model: {args.compression_model}")
+    print(f"Final document model: {args.final_model}")
     print()
     
     # Check for required environment variables
@@ -216,16 +326,36 @@ async def run_deep_research(args):
         print("\nPlease set these environment variables or add them to a .env file")
         return
 
+    # Import the graph only once the inputs are known to be usable, so the error paths above stay fast
+    from open_deep_research.deep_researcher import design_doc_agent
+    from open_deep_research.utils import aclose_github_clients, prompt_cache_usage
+
+    # Identical prompts (re-analysis, repeated sub-agent prompts) are served from the cache
+    try:
+        configure_llm_cache()
+    except (ValueError, ImportError) as e:
+        print(f"Error configuring the LLM cache: {e}")
+        sys.exit(1)
+
+    # One pooled client shared by every OpenAI call in the run, so concurrent sub-agents reuse connections
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+        timeout=httpx.Timeout(600.0, connect=10.0),
+    )
+
     # Configuration for analysis
     config = {
         "configurable": {
             "allow_clarification": False,
-            "max_concurrent_analysis_units": args.max_concurrent,
+            "max_concurrent_analysis_units": max(1, min(args.max_concurrent, MAX_CONCURRENT_LIMIT)),
             "max_analysis_iterations": args.max_iterations,
             "github_repo_url": args.repo_url,
             "github_access_token": github_token,
-            "model": args.model,
+            "analysis_model": qualify_model_name(args.model),
+            "compression_model": qualify_model_name(args.compression_model),
+            "final_design_doc_model": qualify_model_name(args.final_model),
             "temperature": args.temperature,
+            "http_client": http_client,
         }
     }
 
@@ -235,51 +365,90 @@ async def run_deep_research(args):
         print("This analysis may take several minutes depending on repository size...")
         print()
         
-        # Run the design doc agent
-        result = await design_doc_agent.ainvoke(
-            {"messages": [{"role": "user", "content": args.query}]},
-            config=config
-        )
-        
-        print("Analysis Complete!")
-        print("=" * 60)
-        
-        # Extract the content
-        final_message = result["messages"][-1]
-        if hasattr(final_message, 'content'):
-            content = final_message.content
-        elif isinstance(final_message, dict) and 'content' in final_message:
-            content = final_message['content']
-        else:
-            content = str(final_message)
-        
         # Generate filename if not provided
         if args.output:
             filename = args.output
         else:
             filename = generate_output_filename(args.repo_url, args.query)
         
-        # Save the analysis document
+        # Stream the design doc to stdout and the output file as it is generated
+        content_parts = []
+        final_state = {}
         with open(filename, "w") as f:
             f.write(f"# Deep Research Analysis\n")
             f.write(f"*Generated by Open Deep Research*\n\n")
             f.write(f"**Repository:** {args.repo_url}\n")
             f.write(f"**Query:** {args.query}\n")
             f.write(f"**Generated:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"**Model:** {args.model}\n\n")
-            f.write("---\n\n")
-            f.write(content)
-
+            f.writelines(model_header_lines(args))
+            f.write("\n---\n\n")
+            
+            for attempt in range(1, MAX_RUN_ATTEMPTS + 1):
+                try:
+                    async for mode, payload in design_doc_agent.astream(
+                        {"messages": [{"role": "user", "content": args.query}]},
+                        config=config,
+                        stream_mode=["messages", "values"]
+                    ):
+                        if mode == "values":
+                            final_state = payload
+                            continue
+                        chunk, metadata = payload
+                        if metadata.get("langgraph_node") != "final_design_doc_generation":
+                            continue
+                        text = chunk.text()
+                        if text:
+                            sys.stdout.write(text)
+                            sys.stdout.flush()
+                            f.write(text)
+                            content_parts.append(text)
+                    break
+                except Exception as e:
+                    # Once output has been written a rerun would duplicate it, so only retry before that
+                    if content_parts or attempt == MAX_RUN_ATTEMPTS or not is_transient_error(e):
+                        raise
+                    await backoff(attempt, e)
+            
+            content = "".join(content_parts)
+            if not content:
+                # Nothing was streamed (e.g. the final node reported an error), fall back to the final state
+                content = final_state.get("final_design_doc", "")
+                print(content)
+                f.write(content)
+        
+        print()
+        print("Analysis Complete!")
+        print("=" * 60)
         print(f"Analysis saved to: {filename}")
+        print(prompt_cache_usage.summary())
 
-        await interactive_clarification_loop(args, config, filename, content)
+        history = final_state.get("messages") or [{"role": "user", "content": args.query}, {"role": "assistant", "content": content}]
+        await interactive_clarification_loop(args, config, filename, history)
         
     except Exception as e:
         print(f"Error during analysis: {e}")
         sys.exit(1)
+    finally:
+        await http_client.aclose()
+        await aclose_github_clients()
+
+def run_event_loop(coro):
+    """Run the coroutine on uvloop when it is installed (the `speedups` extra), otherwise on the default loop"""
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.run(coro)
+    if sys.version_info >= (3, 11):
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            return runner.run(coro)
+    uvloop.install()
+    return asyncio.run(coro)
 
 def main():
     """Main entry point"""
+    # Load environment variables
+    load_dotenv()
+    
     args = parse_arguments()
     
     # Validate GitHub URL
@@ -288,7 +457,10 @@ def main():
         sys.exit(1)
     
     # Run the analysis
-    asyncio.run(run_deep_research(args))
+    try:
+        run_event_loop(run_deep_research(args))
+    except KeyboardInterrupt:
+        print("\nInterrupted.")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
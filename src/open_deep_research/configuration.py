@@ -1,10 +1,21 @@
 from pydantic import BaseModel, Field
-from typing import Any, List, Optional
+from typing import Any, List, Optional, get_args
 from langchain_core.runnables import RunnableConfig
+import functools
 import os
 from enum import Enum
 
 
+# Snapshot of os.environ, taken on first use so values loaded from .env files are included
+_ENV: Optional[dict[str, str]] = None
+
+
+def _environment() -> dict[str, str]:
+    global _ENV
+    if _ENV is None:
+        _ENV = dict(os.environ)
+    return _ENV
+
 
 class Configuration(BaseModel):
     # General Configuration
@@ -30,6 +41,16 @@ class Configuration(BaseModel):
             }
         }
     )
+    skip_obvious_clarification: bool = Field(
+        default=False,
+        metadata={
+            "x_oap_ui_config": {
+                "type": "boolean",
+                "default": False,
+                "description": "Skip the clarification step when the request already includes a GitHub repository URL and a description of what to document"
+            }
+        }
+    )
     max_concurrent_analysis_units: int = Field(
         default=6,  # Increased for deeper parallel analysis
         metadata={
@@ -131,6 +152,16 @@ class Configuration(BaseModel):
             }
         }
     )
+    final_design_doc_sections_in_parallel: bool = Field(
+        default=False,
+        metadata={
+            "x_oap_ui_config": {
+                "type": "boolean",
+                "default": False,
+                "description": "Write each section of the final design document in its own concurrent model call. Faster for long documents, but the report is not streamed and sections are written without seeing each other."
+            }
+        }
+    )
     # GitHub Configuration
     github_repository: Optional[str] = Field(
         default=None,
@@ -165,18 +196,66 @@ class Configuration(BaseModel):
 
 
 
+    @classmethod
+    def refresh_env(cls) -> None:
+        """Re-read environment overrides, e.g. after changing os.environ at runtime."""
+        global _ENV
+        _ENV = dict(os.environ)
+
     @classmethod
     def from_runnable_config(
         cls, config: Optional[RunnableConfig] = None
     ) -> "Configuration":
         """Create a Configuration instance from a RunnableConfig."""
         configurable = config.get("configurable", {}) if config else {}
-        field_names = list(cls.model_fields.keys())
-        values: dict[str, Any] = {
-            field_name: os.environ.get(field_name.upper(), configurable.get(field_name))
-            for field_name in field_names
-        }
-        return cls(**{k: v for k, v in values.items() if v is not None})
+        env = _environment()
+        frozen_items = tuple(
+            (field_name, value)
+            for field_name in cls.model_fields
+            if (value := env.get(field_name.upper(), configurable.get(field_name))) is not None
+        )
+        try:
+            return _build_configuration(cls, frozen_items)
+        except TypeError:
+            # Unhashable override values can't be cached, so validate them directly.
+            return cls(**dict(frozen_items))
+
+    @classmethod
+    def from_runnable_config_fast(
+        cls, config: Optional[RunnableConfig] = None
+    ) -> "Configuration":
+        """Create a Configuration instance, skipping validation when every value already has its field's type."""
+        configurable = config.get("configurable", {}) if config else {}
+        env = _environment()
+        values: dict[str, Any] = {}
+        for field_name, accepted_types in _field_types(cls).items():
+            value = env.get(field_name.upper(), configurable.get(field_name))
+            if value is None:
+                continue
+            if not isinstance(value, accepted_types):
+                # Needs coercion (e.g. numbers read from the environment), use the validating path
+                return cls.from_runnable_config(config)
+            values[field_name] = value
+        return cls.model_construct(**values)
 
     class Config:
-        arbitrary_types_allowed = True
\ No newline at end of file
+        arbitrary_types_allowed = True
+
+
+@functools.lru_cache(maxsize=32)
+def _build_configuration(cls: type[Configuration], frozen_items: tuple) -> Configuration:
+    """Validate a Configuration once per distinct set of resolved field values."""
+    return cls(**dict(frozen_items))
+
+
+@functools.lru_cache(maxsize=None)
+def _field_types(cls: type[Configuration]) -> dict[str, tuple[type, ...]]:
+    """Map each field to the runtime types it accepts without coercion."""
+    field_types = {}
+    for field_name, field in cls.model_fields.items():
+        annotation = field.annotation
+        if isinstance(annotation, type):
+            field_types[field_name] = (annotation,)
+        else:
+            field_types[field_name] = tuple(arg for arg in get_args(annotation) if isinstance(arg, type))
+    return field_types
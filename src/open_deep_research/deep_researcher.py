@@ -1,9 +1,17 @@
 from langchain.chat_models import init_chat_model
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, ToolMessage, get_buffer_string, filter_messages
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, filter_messages
 from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.utils import gather_with_concurrency
 from langgraph.graph import START, END, StateGraph
 from langgraph.types import Command
+from langgraph.constants import TAG_NOSTREAM
+from langgraph.errors import GraphBubbleUp
 import asyncio
+import os
+import random
+import weakref
+from collections import OrderedDict
+from itertools import chain
 from typing import Literal
 from .configuration import (
     Configuration, 
@@ -21,42 +29,103 @@ from .state import (
 )
 from .prompts import (
     clarify_with_user_instructions,
+    clarify_with_user_messages,
     transform_messages_into_design_query_prompt,
+    transform_messages_into_design_query_messages,
     repository_analysis_system_prompt,
     compress_analysis_system_prompt,
     compress_analysis_simple_human_message,
     final_design_doc_generation_prompt,
-    lead_analyzer_prompt
+    final_design_doc_generation_context,
+    final_design_doc_sections,
+    final_design_doc_section_instruction,
+    lead_analyzer_prompt,
+    lead_analyzer_runtime_context,
+    date_runtime_context
 )
 from .utils import (
     get_today_str,
     is_token_limit_exceeded,
     get_model_token_limit,
+    acount_tokens,
+    select_notes_within_token_limit,
     get_all_tools,
+    get_tools_by_name,
     remove_up_to_last_ai_message,
+    prune_messages_to_token_limit,
     get_api_key_for_model,
-    get_notes_from_tool_calls,
-    analyze_repository_structure
+    get_http_client_kwargs,
+    analyze_repository_structure,
+    render_prompt,
+    fill_prompt,
+    make_message,
+    system_prompt_message,
+    prompt_cache_usage,
+    is_obvious_design_request,
+    ainvoke_structured,
+    buffered_string,
+    normalize_analysis_topic
 )
 
 # Initialize a configurable model that we will use throughout the agent
 configurable_model = init_chat_model(
-    configurable_fields=("model", "max_tokens", "api_key"),
+    configurable_fields=("model", "max_tokens", "api_key", "http_async_client"),
 )
 
+
+# Configured model bindings, reused across node calls instead of being rebuilt on every hop. Tools and
+# HTTP clients are keyed by identity (tools aren't hashable), and each entry keeps them alive so ids aren't reused.
+_CONFIGURED_MODELS_CACHE_SIZE = 64
+_configured_models: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+
+def get_configured_model(model_name: str, max_tokens: int, config: RunnableConfig, tools: tuple = (), max_retries: int = 0, stream: bool = False):
+    api_key = get_api_key_for_model(model_name, config)
+    http_client = get_http_client_kwargs(model_name, config).get("http_async_client")
+    cache_key = (model_name, max_tokens, api_key, id(http_client), tuple(map(id, tools)), max_retries, stream)
+    cached = _configured_models.get(cache_key)
+    if cached is not None:
+        _configured_models.move_to_end(cache_key)
+        return cached[-1]
+    model_config = {
+        "model": model_name,
+        "max_tokens": max_tokens,
+        "api_key": api_key,
+    }
+    if http_client is not None:
+        model_config["http_async_client"] = http_client
+    if not stream:
+        model_config["tags"] = [TAG_NOSTREAM]
+    model_config["callbacks"] = [prompt_cache_usage]
+    model = configurable_model
+    if tools:
+        model = model.bind_tools(list(tools))
+    if max_retries:
+        model = model.with_retry(stop_after_attempt=max_retries)
+    model = model.with_config(model_config)
+    _configured_models[cache_key] = (tools, http_client, model)
+    if len(_configured_models) > _CONFIGURED_MODELS_CACHE_SIZE:
+        _configured_models.popitem(last=False)
+    return model
+
+
 async def clarify_with_user(state: AgentState, config: RunnableConfig) -> Command[Literal["write_design_brief", "__end__"]]:
-    configurable = Configuration.from_runnable_config(config)
+    configurable = Configuration.from_runnable_config_fast(config)
     if not configurable.allow_clarification:
         return Command(goto="write_design_brief")
     messages = state["messages"]
-    model_config = {
-        "model": configurable.analysis_model,
-        "max_tokens": configurable.analysis_model_max_tokens,
-        "api_key": get_api_key_for_model(configurable.analysis_model, config),
-        "tags": ["langsmith:nostream"]
-    }
-    model = configurable_model.with_structured_output(ClarifyWithUser).with_retry(stop_after_attempt=configurable.max_structured_output_retries).with_config(model_config)
-    response = await model.ainvoke([HumanMessage(content=clarify_with_user_instructions.format(messages=get_buffer_string(messages), date=get_today_str()))])
+    if configurable.skip_obvious_clarification and is_obvious_design_request(messages):
+        return Command(goto="write_design_brief")
+    model = get_configured_model(configurable.analysis_model, configurable.analysis_model_max_tokens, config)
+    response = await ainvoke_structured(
+        model,
+        ClarifyWithUser,
+        [
+            system_prompt_message(clarify_with_user_instructions, configurable.analysis_model),
+            HumanMessage(content=fill_prompt(clarify_with_user_messages, messages=buffered_string(messages), date=get_today_str()))
+        ],
+        max_retries=configurable.max_structured_output_retries
+    )
     if response.need_clarification:
         return Command(goto=END, update={"messages": [AIMessage(content=response.question)]})
     else:
@@ -64,18 +133,22 @@ async def clarify_with_user(state: AgentState, config: RunnableConfig) -> Comman
 
 
 async def write_design_brief(state: AgentState, config: RunnableConfig)-> Command[Literal["analysis_supervisor"]]:
-    configurable = Configuration.from_runnable_config(config)
-    analysis_model_config = {
-        "model": configurable.analysis_model,
-        "max_tokens": configurable.analysis_model_max_tokens,
-        "api_key": get_api_key_for_model(configurable.analysis_model, config),
-        "tags": ["langsmith:nostream"]
-    }
-    analysis_model = configurable_model.with_structured_output(DesignDocQuery).with_retry(stop_after_attempt=configurable.max_structured_output_retries).with_config(analysis_model_config)
-    response = await analysis_model.ainvoke([HumanMessage(content=transform_messages_into_design_query_prompt.format(
-        messages=get_buffer_string(state.get("messages", [])),
-        date=get_today_str()
-    ))])
+    configurable = Configuration.from_runnable_config_fast(config)
+    analysis_model = get_configured_model(configurable.analysis_model, configurable.analysis_model_max_tokens, config)
+    today = get_today_str()
+    response = await ainvoke_structured(
+        analysis_model,
+        DesignDocQuery,
+        [
+            system_prompt_message(transform_messages_into_design_query_prompt, configurable.analysis_model),
+            HumanMessage(content=fill_prompt(
+                transform_messages_into_design_query_messages,
+                messages=buffered_string(state.get("messages", [])),
+                date=today
+            ))
+        ],
+        max_retries=configurable.max_structured_output_retries
+    )
     
     # Set up the repository for analysis
     repo_setup_result = await analyze_repository_structure(response.repo_url, config)
@@ -88,10 +161,15 @@ async def write_design_brief(state: AgentState, config: RunnableConfig)-> Comman
             "supervisor_messages": {
                 "type": "override",
                 "value": [
-                    SystemMessage(content=lead_analyzer_prompt.format(
-                        date=get_today_str(),
-                        max_concurrent_analysis_units=configurable.max_concurrent_analysis_units
-                    )),
+                    system_prompt_message(
+                        lead_analyzer_prompt,
+                        configurable.analysis_model,
+                        runtime_context=render_prompt(
+                            lead_analyzer_runtime_context,
+                            date=today,
+                            max_concurrent_analysis_units=configurable.max_concurrent_analysis_units
+                        )
+                    ),
                     HumanMessage(content=f"Repository: {response.repo_url}\n\nDesign Brief: {response.design_brief}\n\nRepo Setup: {repo_setup_result}")
                 ]
             }
@@ -100,15 +178,15 @@ async def write_design_brief(state: AgentState, config: RunnableConfig)-> Comman
 
 
 async def supervisor(state: SupervisorState, config: RunnableConfig) -> Command[Literal["supervisor_tools"]]:
-    configurable = Configuration.from_runnable_config(config)
-    analysis_model_config = {
-        "model": configurable.analysis_model,
-        "max_tokens": configurable.analysis_model_max_tokens,
-        "api_key": get_api_key_for_model(configurable.analysis_model, config),
-        "tags": ["langsmith:nostream"]
-    }
-    lead_analyzer_tools = [AnalyzeRepository, AnalysisComplete]
-    analysis_model = configurable_model.bind_tools(lead_analyzer_tools).with_retry(stop_after_attempt=configurable.max_structured_output_retries).with_config(analysis_model_config)
+    configurable = Configuration.from_runnable_config_fast(config)
+    lead_analyzer_tools = (AnalyzeRepository, AnalysisComplete)
+    analysis_model = get_configured_model(
+        configurable.analysis_model,
+        configurable.analysis_model_max_tokens,
+        config,
+        tools=lead_analyzer_tools,
+        max_retries=configurable.max_structured_output_retries
+    )
     supervisor_messages = state.get("supervisor_messages", [])
     response = await analysis_model.ainvoke(supervisor_messages)
     return Command(
@@ -121,7 +199,7 @@ async def supervisor(state: SupervisorState, config: RunnableConfig) -> Command[
 
 
 async def supervisor_tools(state: SupervisorState, config: RunnableConfig) -> Command[Literal["supervisor", "__end__"]]:
-    configurable = Configuration.from_runnable_config(config)
+    configurable = Configuration.from_runnable_config_fast(config)
     supervisor_messages = state.get("supervisor_messages", [])
     analysis_iterations = state.get("analysis_iterations", 0)
     most_recent_message = supervisor_messages[-1]
@@ -131,50 +209,79 @@ async def supervisor_tools(state: SupervisorState, config: RunnableConfig) -> Co
     # 3. The most recent message contains an AnalysisComplete tool call and there is only one tool call in the message
     exceeded_allowed_iterations = analysis_iterations >= configurable.max_analyzer_iterations
     no_tool_calls = not most_recent_message.tool_calls
-    analysis_complete_tool_call = any(tool_call["name"] == "AnalysisComplete" for tool_call in most_recent_message.tool_calls)
+    # Partition the tool calls in a single pass
+    all_analyze_repository_calls = []
+    analysis_complete_tool_call = False
+    for tool_call in most_recent_message.tool_calls:
+        if tool_call["name"] == "AnalyzeRepository":
+            all_analyze_repository_calls.append(tool_call)
+        elif tool_call["name"] == "AnalysisComplete":
+            analysis_complete_tool_call = True
     if exceeded_allowed_iterations or no_tool_calls or analysis_complete_tool_call:
         return Command(
             goto=END,
             update={
-                "analysis_notes": get_notes_from_tool_calls(supervisor_messages),
                 "repo_url": state.get("repo_url", ""),
                 "design_brief": state.get("design_brief", "")
             }
         )
     # Otherwise, conduct analysis and gather results.
     try:
-        all_analyze_repository_calls = [tool_call for tool_call in most_recent_message.tool_calls if tool_call["name"] == "AnalyzeRepository"]
-        analyze_repository_calls = all_analyze_repository_calls[:configurable.max_concurrent_analysis_units]
-        overflow_analyze_repository_calls = all_analyze_repository_calls[configurable.max_concurrent_analysis_units:]
-        analyzer_system_prompt = repository_analysis_system_prompt.format(date=get_today_str())
+        # Identical topics (ignoring case, punctuation and spacing) share a single analyzer run
+        calls_by_topic = {}
+        for tool_call in all_analyze_repository_calls:
+            calls_by_topic.setdefault(normalize_analysis_topic(tool_call["args"]["analysis_topic"]), []).append(tool_call)
+        topic_keys = list(calls_by_topic)
+        analyze_topic_keys = topic_keys[:configurable.max_concurrent_analysis_units]
+        overflow_topic_keys = topic_keys[configurable.max_concurrent_analysis_units:]
+        analyzer_system_message = system_prompt_message(
+            repository_analysis_system_prompt,
+            configurable.analysis_model,
+            runtime_context=render_prompt(date_runtime_context, date=get_today_str())
+        )
         coros = [
-            analyzer_subgraph.ainvoke({
+            run_analyzer({
                 "analyzer_messages": [
-                    SystemMessage(content=analyzer_system_prompt),
-                    HumanMessage(content=tool_call["args"]["analysis_topic"])
+                    analyzer_system_message,
+                    HumanMessage(content=calls_by_topic[topic_key][0]["args"]["analysis_topic"])
                 ],
-                "analysis_topic": tool_call["args"]["analysis_topic"]
+                "analysis_topic": calls_by_topic[topic_key][0]["args"]["analysis_topic"]
             }, config) 
-            for tool_call in analyze_repository_calls
+            for topic_key in analyze_topic_keys
         ]
-        tool_results = await asyncio.gather(*coros)
-        tool_messages = [ToolMessage(
-                            content=observation.get("compressed_analysis", "Error synthesizing analysis report: Maximum retries exceeded"),
-                            name=tool_call["name"],
-                            tool_call_id=tool_call["id"]
-                        ) for observation, tool_call in zip(tool_results, analyze_repository_calls)]
+        # One failing analyzer shouldn't throw away the others' results; only give up on the turn if they all failed.
+        results = await asyncio.gather(*(capture_exception(coro) for coro in coros))
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors and len(errors) == len(results):
+            raise errors[0]
+        # Duplicate calls each get an answer, but the findings are only noted once per topic
+        tool_messages = []
+        analysis_notes = []
+        for result, topic_key in zip(results, analyze_topic_keys):
+            note = f"Error running analysis: {result}" if isinstance(result, Exception) else result.get("compressed_analysis", "Error synthesizing analysis report: Maximum retries exceeded")
+            analysis_notes.append(note)
+            tool_messages.extend(ToolMessage(
+                content=note,
+                name=tool_call["name"],
+                tool_call_id=tool_call["id"]
+            ) for tool_call in calls_by_topic[topic_key])
+        tool_results = [result for result in results if not isinstance(result, Exception)]
         # Handle any tool calls made > max_concurrent_analysis_units
-        for overflow_analyze_repository_call in overflow_analyze_repository_calls:
-            tool_messages.append(ToolMessage(
-                content=f"Error: Did not run this analysis as you have already exceeded the maximum number of concurrent analysis units. Please try again with {configurable.max_concurrent_analysis_units} or fewer analysis units.",
+        overflow_note = f"Error: Did not run this analysis as you have already exceeded the maximum number of concurrent analysis units. Please try again with {configurable.max_concurrent_analysis_units} or fewer analysis units."
+        for topic_key in overflow_topic_keys:
+            analysis_notes.append(overflow_note)
+            tool_messages.extend(ToolMessage(
+                content=overflow_note,
                 name="AnalyzeRepository",
                 tool_call_id=overflow_analyze_repository_call["id"]
-            ))
-        raw_analysis_concat = "\n".join(["\n".join(observation.get("raw_analysis", [])) for observation in tool_results])
+            ) for overflow_analyze_repository_call in calls_by_topic[topic_key])
+        raw_analysis_concat = "\n".join(chain.from_iterable(observation.get("raw_analysis", ()) for observation in tool_results))
         return Command(
             goto="supervisor",
             update={
                 "supervisor_messages": tool_messages,
+                # Notes accumulate turn by turn, so the exit branches don't need to rescan the conversation
+                "analysis_notes": analysis_notes,
                 "raw_analysis": [raw_analysis_concat]
             }
         )
@@ -186,13 +293,50 @@ async def supervisor_tools(state: SupervisorState, config: RunnableConfig) -> Co
         return Command(
             goto=END,
             update={
-                "analysis_notes": get_notes_from_tool_calls(supervisor_messages),
                 "repo_url": state.get("repo_url", ""),
                 "design_brief": state.get("design_brief", "")
             }
         )
 
 
+# Process-wide cap on in-flight analyzer subgraphs, shared by every supervisor running on the same event loop
+DEFAULT_MAX_INFLIGHT_ANALYZERS = 20
+_analyzer_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def max_inflight_analyzers() -> int:
+    """MAX_INFLIGHT_ANALYZERS from the environment, or the default if it isn't a positive integer."""
+    value = os.getenv("MAX_INFLIGHT_ANALYZERS")
+    if value is None:
+        return DEFAULT_MAX_INFLIGHT_ANALYZERS
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        print(f"Ignoring invalid MAX_INFLIGHT_ANALYZERS={value!r}, using {DEFAULT_MAX_INFLIGHT_ANALYZERS}")
+        return DEFAULT_MAX_INFLIGHT_ANALYZERS
+    return limit
+
+
+async def run_analyzer(analyzer_input: dict, config: RunnableConfig):
+    loop = asyncio.get_running_loop()
+    semaphore = _analyzer_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _analyzer_semaphores[loop] = asyncio.Semaphore(max_inflight_analyzers())
+    async with semaphore:
+        return await analyzer_subgraph.ainvoke(analyzer_input, config)
+
+
+async def capture_exception(coro):
+    try:
+        return await coro
+    except GraphBubbleUp:
+        raise
+    except Exception as e:
+        return e
+
+
 supervisor_builder = StateGraph(SupervisorState, config_schema=Configuration)
 supervisor_builder.add_node("supervisor", supervisor)
 supervisor_builder.add_node("supervisor_tools", supervisor_tools)
@@ -201,18 +345,18 @@ supervisor_subgraph = supervisor_builder.compile()
 
 
 async def analyzer(state: AnalyzerState, config: RunnableConfig) -> Command[Literal["analyzer_tools"]]:
-    configurable = Configuration.from_runnable_config(config)
+    configurable = Configuration.from_runnable_config_fast(config)
     analyzer_messages = state.get("analyzer_messages", [])
     tools = await get_all_tools(config)
     if len(tools) == 0:
         raise ValueError("No tools found to conduct analysis: Please configure GitHub access token and repository URL.")
-    analysis_model_config = {
-        "model": configurable.analysis_model,
-        "max_tokens": configurable.analysis_model_max_tokens,
-        "api_key": get_api_key_for_model(configurable.analysis_model, config),
-        "tags": ["langsmith:nostream"]
-    }
-    analysis_model = configurable_model.bind_tools(tools).with_retry(stop_after_attempt=configurable.max_structured_output_retries).with_config(analysis_model_config)
+    analysis_model = get_configured_model(
+        configurable.analysis_model,
+        configurable.analysis_model_max_tokens,
+        config,
+        tools=tuple(tools),
+        max_retries=configurable.max_structured_output_retries
+    )
     # NOTE: Need to add fault tolerance here.
     response = await analysis_model.ainvoke(analyzer_messages)
     return Command(
@@ -232,7 +376,7 @@ async def execute_tool_safely(tool, args, config):
 
 
 async def analyzer_tools(state: AnalyzerState, config: RunnableConfig) -> Command[Literal["analyzer", "compress_analysis"]]:
-    configurable = Configuration.from_runnable_config(config)
+    configurable = Configuration.from_runnable_config_fast(config)
     analyzer_messages = state.get("analyzer_messages", [])
     most_recent_message = analyzer_messages[-1]
     # Early Exit Criteria: No tool calls were made by the analyzer
@@ -241,8 +385,7 @@ async def analyzer_tools(state: AnalyzerState, config: RunnableConfig) -> Comman
             goto="compress_analysis",
         )
     # Otherwise, execute tools and gather results.
-    tools = await get_all_tools(config)
-    tools_by_name = {tool.name if hasattr(tool, "name") else tool.get("name", "github_analysis"):tool for tool in tools}
+    tools_by_name = await get_tools_by_name(config)
     tool_calls = most_recent_message.tool_calls
     coros = [execute_tool_safely(tools_by_name[tool_call["name"]], tool_call["args"], config) for tool_call in tool_calls]
     observations = await asyncio.gather(*coros)
@@ -270,35 +413,46 @@ async def analyzer_tools(state: AnalyzerState, config: RunnableConfig) -> Comman
 
 
 async def compress_analysis(state: AnalyzerState, config: RunnableConfig):
-    configurable = Configuration.from_runnable_config(config)
+    configurable = Configuration.from_runnable_config_fast(config)
     synthesis_attempts = 0
-    synthesizer_model = configurable_model.with_config({
-        "model": configurable.compression_model,
-        "max_tokens": configurable.compression_model_max_tokens,
-        "api_key": get_api_key_for_model(configurable.compression_model, config),
-        "tags": ["langsmith:nostream"]
-    })
-    analyzer_messages = state.get("analyzer_messages", [])
-    # Update the system prompt to now focus on compression rather than analysis.
-    analyzer_messages[0] = SystemMessage(content=compress_analysis_system_prompt.format(date=get_today_str()))
-    analyzer_messages.append(HumanMessage(content=compress_analysis_simple_human_message))
+    synthesizer_model = get_configured_model(configurable.compression_model, configurable.compression_model_max_tokens, config)
+    # Swap the system prompt to focus on compression rather than analysis, in a new list so the state isn't mutated.
+    state_messages = state.get("analyzer_messages", [])
+    analyzer_messages = [system_prompt_message(
+        compress_analysis_system_prompt,
+        configurable.compression_model,
+        runtime_context=render_prompt(date_runtime_context, date=get_today_str())
+    )]
+    analyzer_messages.extend(state_messages[1:])
+    analyzer_messages.append(make_message("human", compress_analysis_simple_human_message))
+    # Built once from the full history, so pruning for a retry doesn't drop anything from the raw analysis
+    raw_analysis = "\n".join(str(m.content) for m in filter_messages(state_messages, include_types=["tool", "ai"]))
     while synthesis_attempts < 3:
         try:
             response = await synthesizer_model.ainvoke(analyzer_messages)
             return {
                 "compressed_analysis": str(response.content),
-                "raw_analysis": ["\n".join([str(m.content) for m in filter_messages(analyzer_messages, include_types=["tool", "ai"])])]
+                "raw_analysis": [raw_analysis]
             }
         except Exception as e:
             synthesis_attempts += 1
-            if is_token_limit_exceeded(e, configurable.analysis_model):
-                analyzer_messages = remove_up_to_last_ai_message(analyzer_messages)
+            if is_token_limit_exceeded(e, configurable.compression_model):
+                # Prune to an estimated 90% of the context window so the next attempt fits, rather than
+                # dropping one turn at a time and hitting the limit again.
+                model_token_limit = get_model_token_limit(configurable.compression_model)
+                pruned_messages = prune_messages_to_token_limit(analyzer_messages, int(model_token_limit * 0.9)) if model_token_limit else analyzer_messages
+                if len(pruned_messages) < len(analyzer_messages):
+                    analyzer_messages = pruned_messages
+                else:
+                    analyzer_messages = remove_up_to_last_ai_message(analyzer_messages)
                 print(f"Token limit exceeded while synthesizing: {e}. Pruning the messages to try again.")
                 continue         
             print(f"Error synthesizing analysis report: {e}")
+            if synthesis_attempts < 3:
+                await asyncio.sleep(min(2 ** synthesis_attempts + random.random(), 8))
     return {
         "compressed_analysis": "Error synthesizing analysis report: Maximum retries exceeded",
-        "raw_analysis": ["\n".join([str(m.content) for m in filter_messages(analyzer_messages, include_types=["tool", "ai"])])]
+        "raw_analysis": [raw_analysis]
     }
 
 
@@ -314,25 +468,53 @@ analyzer_subgraph = analyzer_builder.compile()
 async def final_design_doc_generation(state: AgentState, config: RunnableConfig):
     analysis_notes = state.get("analysis_notes", [])
     cleared_state = {"analysis_notes": {"type": "override", "value": []},}
-    configurable = Configuration.from_runnable_config(config)
-    writer_model_config = {
-        "model": configurable.final_design_doc_model,
-        "max_tokens": configurable.final_design_doc_model_max_tokens,
-        "api_key": get_api_key_for_model(configurable.analysis_model, config),
-    }
+    configurable = Configuration.from_runnable_config_fast(config)
+    # Left untagged so the report streams to callers
+    writer_model = get_configured_model(configurable.final_design_doc_model, configurable.final_design_doc_model_max_tokens, config, stream=True)
     
     findings = "\n".join(analysis_notes)
+    today = get_today_str()
+    model_token_limit = get_model_token_limit(configurable.final_design_doc_model)
+    findings_token_budget = None
+    if model_token_limit:
+        # The findings share the context window with the prompts around them and with the report itself
+        prompt_texts = [
+            final_design_doc_generation_prompt,
+            fill_prompt(final_design_doc_generation_context, repo_url=state.get("repo_url", ""), design_brief=state.get("design_brief", ""), findings="", date=today)
+        ]
+        if configurable.final_design_doc_sections_in_parallel:
+            prompt_texts.extend(fill_prompt(final_design_doc_section_instruction, number=number, section=section) for number, section in enumerate(final_design_doc_sections, start=1))
+        prompt_token_counts = await acount_tokens(prompt_texts, configurable.final_design_doc_model)
+        prompt_overhead = sum(prompt_token_counts[:2]) + max(prompt_token_counts[2:], default=0)
+        findings_token_budget = max(model_token_limit - configurable.final_design_doc_model_max_tokens - prompt_overhead, 0)
+    findings_token_limit = None
+    # When the findings clearly can't fit, trim them up front instead of paying for a rejected request first.
+    # Only count tokens when a generous chars-per-token estimate already says we might be over.
+    if findings_token_budget is not None and len(findings) // 3 > findings_token_budget:
+        note_token_counts = await acount_tokens(analysis_notes, configurable.final_design_doc_model)
+        if sum(note_token_counts) > findings_token_budget:
+            findings_token_limit = findings_token_budget
+            print("Reducing the findings to", findings_token_limit, "tokens")
+            findings = select_notes_within_token_limit(analysis_notes, note_token_counts, findings_token_limit)
     max_retries = 3
     current_retry = 0
     while current_retry <= max_retries:
-        final_design_doc_prompt = final_design_doc_generation_prompt.format(
+        final_design_doc_context = fill_prompt(
+            final_design_doc_generation_context,
             repo_url=state.get("repo_url", ""),
             design_brief=state.get("design_brief", ""),
             findings=findings,
-            date=get_today_str()
+            date=today
         )
+        final_design_doc_messages = [
+            system_prompt_message(final_design_doc_generation_prompt, configurable.final_design_doc_model),
+            HumanMessage(content=final_design_doc_context)
+        ]
         try:
-            final_design_doc = await configurable_model.with_config(writer_model_config).ainvoke([HumanMessage(content=final_design_doc_prompt)])
+            if configurable.final_design_doc_sections_in_parallel:
+                final_design_doc = await generate_design_doc_sections(final_design_doc_messages, configurable, config)
+            else:
+                final_design_doc = await writer_model.ainvoke(final_design_doc_messages)
             return {
                 "final_design_doc": final_design_doc.content, 
                 "messages": [final_design_doc],
@@ -340,18 +522,19 @@ async def final_design_doc_generation(state: AgentState, config: RunnableConfig)
             }
         except Exception as e:
             if is_token_limit_exceeded(e, configurable.final_design_doc_model):
-                if current_retry == 0:
-                    model_token_limit = get_model_token_limit(configurable.final_design_doc_model)
+                if findings_token_limit is None:
                     if not model_token_limit:
                         return {
                             "final_design_doc": f"Error generating final design document: Token limit exceeded, however, we could not determine the model's maximum context length. Please update the model map in deep_researcher/utils.py with this information. {e}",
                             **cleared_state
                         }
-                    findings_token_limit = model_token_limit * 4
+                    findings_token_limit = findings_token_budget
+                    # Counted once; each retry then keeps as many whole notes as fit rather than cutting mid-note
+                    note_token_counts = await acount_tokens(analysis_notes, configurable.final_design_doc_model)
                 else:
                     findings_token_limit = int(findings_token_limit * 0.9)
-                print("Reducing the chars to", findings_token_limit)
-                findings = findings[:findings_token_limit]
+                print("Reducing the findings to", findings_token_limit, "tokens")
+                findings = select_notes_within_token_limit(analysis_notes, note_token_counts, findings_token_limit)
                 current_retry += 1
             else:
                 # If not a token limit exceeded error, then we just throw an error.
@@ -365,6 +548,17 @@ async def final_design_doc_generation(state: AgentState, config: RunnableConfig)
         **cleared_state
     }
 
+async def generate_design_doc_sections(messages, configurable: Configuration, config: RunnableConfig) -> AIMessage:
+    # Every section shares the same system prompt and findings prefix, so the provider can serve it from its prompt cache.
+    # Sections are not streamed, as concurrent streams would interleave in the output.
+    section_model = get_configured_model(configurable.final_design_doc_model, configurable.final_design_doc_model_max_tokens, config)
+    sections = await gather_with_concurrency(configurable.max_concurrent_analysis_units, *(
+        section_model.ainvoke([*messages, HumanMessage(content=fill_prompt(final_design_doc_section_instruction, number=number, section=section))])
+        for number, section in enumerate(final_design_doc_sections, start=1)
+    ))
+    return AIMessage(content="\n\n".join(str(section.content).strip() for section in sections))
+
+
 design_doc_agent_builder = StateGraph(AgentState, input=AgentInputState, config_schema=Configuration)
 design_doc_agent_builder.add_node("clarify_with_user", clarify_with_user)
 design_doc_agent_builder.add_node("write_design_brief", write_design_brief)
@@ -1,5 +1,5 @@
 from typing import Annotated, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 import operator
 from langgraph.graph import MessagesState
 from langchain_core.messages import MessageLikeRepresentation
@@ -10,18 +10,22 @@ from typing_extensions import TypedDict
 ###################
 class AnalyzeRepository(BaseModel):
     """Call this tool to analyze a specific aspect of the repository."""
+    model_config = ConfigDict(frozen=True)
     analysis_topic: str = Field(
         description="The specific aspect of the repository to analyze. Should be a single topic, and should be described in high detail (at least a paragraph).",
     )
 
 class AnalysisComplete(BaseModel):
     """Call this tool to indicate that the repository analysis is complete."""
+    model_config = ConfigDict(frozen=True)
 
 class Summary(BaseModel):
+    model_config = ConfigDict(frozen=True)
     summary: str
     key_excerpts: str
 
 class ClarifyWithUser(BaseModel):
+    model_config = ConfigDict(frozen=True)
     need_clarification: bool = Field(
         description="Whether the user needs to be asked a clarifying question.",
     )
@@ -33,6 +37,7 @@ class ClarifyWithUser(BaseModel):
     )
 
 class DesignDocQuery(BaseModel):
+    model_config = ConfigDict(frozen=True)
     repo_url: str = Field(
         description="The GitHub repository URL to analyze.",
     )
@@ -48,35 +53,41 @@ class DesignDocQuery(BaseModel):
 def override_reducer(current_value, new_value):
     if isinstance(new_value, dict) and new_value.get("type") == "override":
         return new_value.get("value", new_value)
-    else:
-        return operator.add(current_value, new_value)
+    # Skip the copy when one side is empty. Lists are never extended in place: the current value may
+    # already have been handed to nodes or emitted in a stream.
+    if not new_value:
+        return current_value
+    if not current_value:
+        return new_value
+    return operator.add(current_value, new_value)
     
 class AgentInputState(MessagesState):
     """InputState is only 'messages'"""
 
+# TypedDict states can't carry defaults: reducer channels start empty and nodes read the rest with state.get(key, default)
 class AgentState(MessagesState):
     supervisor_messages: Annotated[list[MessageLikeRepresentation], override_reducer]
     repo_url: Optional[str]
     design_brief: Optional[str]
-    raw_analysis: Annotated[list[str], override_reducer] = []
-    analysis_notes: Annotated[list[str], override_reducer] = []
+    raw_analysis: Annotated[list[str], override_reducer]
+    analysis_notes: Annotated[list[str], override_reducer]
     final_design_doc: str
 
 class SupervisorState(TypedDict):
     supervisor_messages: Annotated[list[MessageLikeRepresentation], override_reducer]
     repo_url: str
     design_brief: str
-    analysis_notes: Annotated[list[str], override_reducer] = []
-    analysis_iterations: int = 0
-    raw_analysis: Annotated[list[str], override_reducer] = []
+    analysis_notes: Annotated[list[str], override_reducer]
+    analysis_iterations: int
+    raw_analysis: Annotated[list[str], override_reducer]
 
 class AnalyzerState(TypedDict):
     analyzer_messages: Annotated[list[MessageLikeRepresentation], operator.add]
-    tool_call_iterations: int = 0
+    tool_call_iterations: int
     analysis_topic: str
     compressed_analysis: str
-    raw_analysis: Annotated[list[str], override_reducer] = []
+    raw_analysis: Annotated[list[str], override_reducer]
 
 class AnalyzerOutputState(BaseModel):
     compressed_analysis: str
-    raw_analysis: Annotated[list[str], override_reducer] = []
\ No newline at end of file
+    raw_analysis: Annotated[list[str], override_reducer] = Field(default_factory=list)
\ No newline at end of file
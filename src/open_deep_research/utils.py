@@ -1,20 +1,29 @@
 import os
+import re
+import string
 import asyncio
+import functools
+import weakref
+import time
 import logging
-import requests
-import base64
+import httpx
 import json
-from datetime import datetime
-from typing import Annotated, List, Literal, Dict, Optional, Any
+from collections import Counter, OrderedDict, deque
+from datetime import date
+from itertools import islice
+from urllib.parse import urlsplit
+from uuid import UUID
+from types import MappingProxyType
+from typing import Annotated, Callable, List, Literal, Dict, Mapping, Optional, Any
 from langchain_core.tools import BaseTool, StructuredTool, tool, ToolException, InjectedToolArg
-from langchain_core.messages import HumanMessage, AIMessage, MessageLikeRepresentation, filter_messages
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, AIMessage, ToolMessage, MessageLikeRepresentation, get_buffer_string
 from langchain_core.runnables import RunnableConfig
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
 from langchain_core.language_models import BaseChatModel
 from langchain.chat_models import init_chat_model
+from pydantic import BaseModel
 
-
-from langchain_community.utilities.github import GitHubAPIWrapper
-from langchain_community.agent_toolkits.github.toolkit import GitHubToolkit
 from open_deep_research.state import Summary, AnalysisComplete
 from open_deep_research.configuration import Configuration
 
@@ -27,30 +36,335 @@ GITHUB_ANALYSIS_DESCRIPTION = (
     "Useful for understanding codebase structure, reading files, and analyzing repository content."
 )
 
+# Pooled GitHub clients keyed by token, one set per event loop because httpx connections are
+# bound to the loop that opened them. Keeping them alive reuses TCP/TLS connections across tool calls.
+_github_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+
+def _github_client(github_token: str) -> httpx.AsyncClient:
+    """Get the shared async HTTP client authenticated against the GitHub REST API."""
+    clients = _github_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(github_token)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            headers={"Authorization": f"token {github_token}", "Accept": "application/vnd.github.v3+json"},
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10, keepalive_expiry=60.0),
+        )
+        clients[github_token] = client
+    return client
+
+async def aclose_github_clients() -> None:
+    """Close the pooled GitHub clients opened on the running event loop, e.g. at the end of a run."""
+    clients = _github_clients.pop(asyncio.get_running_loop(), {})
+    await asyncio.gather(*(client.aclose() for client in clients.values()))
+
+# File contents are requested raw, which skips the base64-encoded JSON envelope
+GITHUB_RAW_HEADERS = {"Accept": "application/vnd.github.raw"}
+
+# Raw files can be up to 100 MB; only this much of one is read, so a huge file can't flood the prompt
+GITHUB_MAX_FILE_BYTES = 1024 * 1024
+_GITHUB_TRUNCATED_HEADER = "X-Body-Truncated"
+
+# Rate-limited requests are retried this many times, waiting at most GITHUB_MAX_RETRY_DELAY seconds each
+GITHUB_MAX_RETRIES = 3
+GITHUB_MAX_RETRY_DELAY = 60.0
+
+# Maximum number of /search/code requests a single tool call keeps in flight
+GITHUB_SEARCH_CONCURRENCY = 5
+
+# GitHub responses keyed by (token, Accept header, URL). Fresh entries are served from memory;
+# stale ones are revalidated with If-None-Match, and a 304 doesn't count against the rate limit.
+_GITHUB_CACHE_SIZE = 512
+_GITHUB_CACHE_TTL = 300.0
+# Bodies are bounded in total, and ones too large to be worth keeping (big files, huge trees) aren't cached
+_GITHUB_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_GITHUB_CACHE_MAX_ENTRY_BYTES = 4 * 1024 * 1024
+_github_cache: "OrderedDict[tuple[str, str, str], tuple[float, httpx.Response]]" = OrderedDict()
+_github_cache_bytes = 0
+_github_inflight: "dict[tuple[str, str, str], asyncio.Future]" = {}
+
+def _is_directory_listing(response: httpx.Response) -> bool:
+    """Whether a contents API response is a directory listing rather than a file."""
+    if not response.headers.get("Content-Type", "").startswith("application/json"):
+        return False
+    try:
+        return isinstance(response.json(), list)
+    except ValueError:
+        return False
+
+class _AsyncRateLimiter:
+    """Async context manager allowing at most max_rate entries per time_period seconds (sliding window)."""
+    
+    def __init__(self, max_rate: int, time_period: float):
+        self.max_rate = max_rate
+        self.time_period = time_period
+        self._entries: deque[float] = deque()
+    
+    async def __aenter__(self):
+        while True:
+            now = time.monotonic()
+            while self._entries and now - self._entries[0] >= self.time_period:
+                self._entries.popleft()
+            if len(self._entries) < self.max_rate:
+                self._entries.append(now)
+                return
+            await asyncio.sleep(self.time_period - (now - self._entries[0]))
+    
+    async def __aexit__(self, *exc_info):
+        return False
+
+# Client-side pacing that matches GitHub's budgets: code search has its own 30 requests/minute
+# limit, separate from the 5,000 requests/hour primary limit for everything else
+_github_search_limiter = _AsyncRateLimiter(max_rate=30, time_period=60.0)
+_github_core_limiter = _AsyncRateLimiter(max_rate=5000, time_period=3600.0)
+
+def _github_rate_limit_delay(response: httpx.Response, attempt: int) -> Optional[float]:
+    """Seconds to wait before retrying a rate-limited response, or None if it isn't rate limited."""
+    if response.status_code not in (403, 429):
+        return None
+    retry_after = response.headers.get("Retry-After")
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    if response.headers.get("X-RateLimit-Remaining") == "0":
+        reset = response.headers.get("X-RateLimit-Reset", "")
+        if reset.isdigit():
+            return max(int(reset) - time.time(), 0.0)
+    # A plain 403 is a permissions error; only 429 is worth retrying without a hint
+    if response.status_code == 429:
+        return float(2 ** attempt)
+    return None
+
+async def _github_send(client: httpx.AsyncClient, url: httpx.URL, headers: dict, max_bytes: Optional[int]) -> httpx.Response:
+    """GET url, reading at most max_bytes of the body. A cut-off body is marked with _GITHUB_TRUNCATED_HEADER."""
+    if max_bytes is None:
+        return await client.get(url, headers=headers)
+    async with client.stream("GET", url, headers=headers) as response:
+        # Stop reading once past the limit; leaving the block then drops the rest of the download
+        body = bytearray()
+        async for chunk in response.aiter_bytes():
+            body += chunk
+            if len(body) > max_bytes:
+                break
+        truncated = len(body) > max_bytes
+        del body[max_bytes:]
+    # The body is already decoded, so it mustn't be decoded or length-checked again
+    headers = [(name, value) for name, value in response.headers.multi_items() if name.lower() not in ("content-encoding", "content-length")]
+    if truncated:
+        headers.append((_GITHUB_TRUNCATED_HEADER, "1"))
+    return httpx.Response(response.status_code, headers=headers, content=bytes(body), request=response.request)
+
+async def _github_request_with_retry(client: httpx.AsyncClient, url: httpx.URL, headers: dict, max_bytes: Optional[int] = None) -> httpx.Response:
+    """GET a GitHub URL, honoring Retry-After / X-RateLimit-Reset with exponential backoff."""
+    limiter = _github_search_limiter if url.path.startswith("/search/") else _github_core_limiter
+    for attempt in range(GITHUB_MAX_RETRIES + 1):
+        async with limiter:
+            response = await _github_send(client, url, headers, max_bytes)
+        delay = _github_rate_limit_delay(response, attempt)
+        # A reset further off than the cap would only fail again after the wait, so report the rate limit now
+        if delay is None or attempt == GITHUB_MAX_RETRIES or delay > GITHUB_MAX_RETRY_DELAY:
+            return response
+        # Never wait less than the backoff step
+        delay = max(delay, 2 ** attempt)
+        logging.warning(f"GitHub rate limit hit for {url}, retrying in {delay:.0f}s")
+        await asyncio.sleep(delay)
+    return response
+
+async def _github_get(client: httpx.AsyncClient, url: str, params: Optional[dict] = None, headers: Optional[dict] = None, max_bytes: Optional[int] = None) -> httpx.Response:
+    """GET a GitHub API URL, serving repeated requests from an in-memory ETag cache.
+
+    A given URL and Accept header must always be requested with the same max_bytes, as they share a cache entry.
+    """
+    request_url = httpx.URL(url)
+    if params:
+        request_url = request_url.copy_merge_params(params)
+    headers = dict(headers or {})
+    accept = headers.get("Accept", client.headers.get("Accept", ""))
+    cache_key = (client.headers.get("Authorization", ""), accept, str(request_url))
+    cached = _github_cache.get(cache_key)
+    if cached is not None:
+        fetched_at, cached_response = cached
+        _github_cache.move_to_end(cache_key)
+        if time.monotonic() - fetched_at < _GITHUB_CACHE_TTL:
+            return cached_response
+    # Concurrent callers asking for the same URL share one request
+    fetch = _github_inflight.get(cache_key)
+    if fetch is None or fetch.get_loop() is not asyncio.get_running_loop():
+        fetch = asyncio.ensure_future(_github_fetch(client, request_url, headers, cache_key, cached, max_bytes))
+        _github_inflight[cache_key] = fetch
+        fetch.add_done_callback(functools.partial(_discard_inflight, cache_key))
+    # Shield the shared request so one cancelled caller doesn't cancel it for everyone else
+    return await asyncio.shield(fetch)
+
+async def _github_get_file(client: httpx.AsyncClient, github_repository: str, file_path: str) -> httpx.Response:
+    """GET a file's raw contents, reading at most GITHUB_MAX_FILE_BYTES of it."""
+    return await _github_get(client, f"https://api.github.com/repos/{github_repository}/contents/{file_path}", headers=GITHUB_RAW_HEADERS, max_bytes=GITHUB_MAX_FILE_BYTES)
+
+def _truncation_note(response: httpx.Response, file_path: str) -> str:
+    """A note for the tool output when only the start of a large file was read, otherwise ''."""
+    if _GITHUB_TRUNCATED_HEADER not in response.headers:
+        return ""
+    return f"**Note**: {file_path} is larger than {GITHUB_MAX_FILE_BYTES // 1024} KB; only the start of the file was read.\n"
+
+def _discard_inflight(cache_key: tuple[str, str, str], fetch: asyncio.Future) -> None:
+    if _github_inflight.get(cache_key) is fetch:
+        del _github_inflight[cache_key]
+
+async def _github_fetch(client: httpx.AsyncClient, request_url: httpx.URL, headers: dict, cache_key: tuple[str, str, str], cached: Optional[tuple[float, httpx.Response]], max_bytes: Optional[int] = None) -> httpx.Response:
+    """Fetch a GitHub URL, revalidating any stale cache entry, and store the result in the cache."""
+    if cached is not None and (etag := cached[1].headers.get("ETag")):
+        headers = {**headers, "If-None-Match": etag}
+    response = await _github_request_with_retry(client, request_url, headers, max_bytes)
+    if response.status_code == 304 and cached is not None:
+        response = cached[1]
+    # Missing files are cached too: most config-file probes come back 404
+    if response.status_code in (200, 404):
+        _store_github_response(cache_key, response)
+    return response
+
+def _store_github_response(cache_key: tuple[str, str, str], response: httpx.Response) -> None:
+    """Cache a response, evicting the least recently used ones to stay within the entry and byte budgets."""
+    global _github_cache_bytes
+    previous = _github_cache.pop(cache_key, None)
+    if previous is not None:
+        _github_cache_bytes -= len(previous[1].content)
+    size = len(response.content)
+    if size > _GITHUB_CACHE_MAX_ENTRY_BYTES:
+        return
+    _github_cache[cache_key] = (time.monotonic(), response)
+    _github_cache_bytes += size
+    while len(_github_cache) > _GITHUB_CACHE_SIZE or _github_cache_bytes > _GITHUB_CACHE_MAX_BYTES:
+        _, (_, evicted) = _github_cache.popitem(last=False)
+        _github_cache_bytes -= len(evicted.content)
+
+# Directory listings parsed from git trees responses, keyed by (token, repository) and kept separately from the
+# response cache, which won't hold a large monorepo's tree. None records a truncated tree.
+_REPO_TREE_CACHE_SIZE = 32
+_repo_tree_listings: "OrderedDict[tuple[str, str], tuple[float, Optional[str], Optional[dict[str, list[dict]]]]]" = OrderedDict()
+
+def _parse_repo_tree(tree: dict) -> Optional[dict[str, list[dict]]]:
+    if tree.get("truncated"):
+        return None
+    listings = {"": []}
+    for entry in tree.get("tree", []):
+        parent, _, name = entry["path"].rpartition("/")
+        item_type = "dir" if entry["type"] == "tree" else "file"
+        if item_type == "dir":
+            listings.setdefault(entry["path"], [])
+        listings.setdefault(parent, []).append({"name": name, "path": entry["path"], "type": item_type})
+    return listings
+
+async def _get_repo_tree(client: httpx.AsyncClient, github_repository: str) -> Optional[dict[str, list[dict]]]:
+    """Map every directory in the default branch ('' for the root) to its entries, using one git trees request.
+    
+    Returns None when the tree is unavailable or truncated, so callers can fall back to the contents API.
+    """
+    cache_key = (client.headers.get("Authorization", ""), github_repository)
+    cached = _repo_tree_listings.get(cache_key)
+    if cached is not None and time.monotonic() - cached[0] < _GITHUB_CACHE_TTL:
+        _repo_tree_listings.move_to_end(cache_key)
+        return cached[2]
+    response = await _github_get(client, f"https://api.github.com/repos/{github_repository}/git/trees/HEAD", params={"recursive": "1"})
+    if response.status_code != 200:
+        return None
+    etag = response.headers.get("ETag")
+    # Re-read, as a concurrent caller may have just parsed this same tree
+    cached = _repo_tree_listings.get(cache_key)
+    if cached is not None and etag and cached[1] == etag:
+        listings = cached[2]
+    else:
+        listings = _parse_repo_tree(response.json())
+    _repo_tree_listings[cache_key] = (time.monotonic(), etag, listings)
+    _repo_tree_listings.move_to_end(cache_key)
+    if len(_repo_tree_listings) > _REPO_TREE_CACHE_SIZE:
+        _repo_tree_listings.popitem(last=False)
+    return listings
+
+async def _list_directory(client: httpx.AsyncClient, github_repository: str, directory_path: str = "") -> tuple[int, list[dict]]:
+    """List a directory as (status code, entries), served from the cached repository tree when possible."""
+    directory_path = directory_path.strip("/")
+    listings = await _get_repo_tree(client, github_repository)
+    if listings is not None:
+        if directory_path not in listings:
+            return 404, []
+        return 200, listings[directory_path]
+    url = f"https://api.github.com/repos/{github_repository}/contents"
+    if directory_path:
+        url += f"/{directory_path}"
+    response = await _github_get(client, url)
+    if response.status_code != 200:
+        return response.status_code, []
+    return 200, response.json()
+
+# Import statements, class names and function names in Python source, matched in a single pass.
+# Leading indentation is allowed so methods and nested imports are picked up too.
+_PY_STRUCTURE_PATTERN = re.compile(
+    r"^[^\S\n]*(?:(?P<imp>(?:import|from) [^\n]*?)[^\S\n]*$|class (?P<cls>\w+)|def (?P<fn>\w+))",
+    re.MULTILINE,
+)
+
+# Potential function calls within a line of Python source
+_FUNCTION_CALL_PATTERN = re.compile(r"(\w+)\(")
+
+# The cell_type key of each notebook cell; escaped quotes are skipped so cell sources quoting it don't count
+_NOTEBOOK_CELL_TYPE_PATTERN = re.compile(r'(?<!\\)"cell_type"\s*:\s*"(\w+)"')
+
+def _scan_python_structure(content: str) -> tuple[list[str], list[str], list[str]]:
+    """Return the import lines, class names and function names found in Python source."""
+    imports, classes, functions = [], [], []
+    for match in _PY_STRUCTURE_PATTERN.finditer(content):
+        if match["imp"] is not None:
+            imports.append(match["imp"])
+        elif match["cls"] is not None:
+            classes.append(match["cls"])
+        else:
+            functions.append(match["fn"])
+    return imports, classes, functions
+
+# File classification sets: extensions are compared lowercased and without the leading dot
+_SOURCE_EXTENSIONS = frozenset({'py', 'js', 'ts', 'java', 'cpp', 'c', 'go', 'rs', 'rb'})
+_DOCUMENTATION_EXTENSIONS = frozenset({'md', 'txt', 'rst', 'doc'})
+_DIRECTORY_CONFIG_FILES = frozenset({'requirements.txt', 'setup.py', 'pyproject.toml', '.gitignore', 'Dockerfile', 'README.md'})
+
+def _file_extension(name: str) -> str:
+    """Lowercased extension of a file name without the dot, or '' if it has none."""
+    _, dot, extension = name.rpartition('.')
+    return extension.lower() if dot else ''
+
+# Root-level config files and the technology each one indicates, if any
+_REPO_CONFIG_FILES = {
+    'requirements.txt': "Python",
+    'package.json': "Node.js/JavaScript",
+    'pyproject.toml': "Python",
+    'setup.py': "Python",
+    'Dockerfile': "Docker",
+    '.gitignore': None,
+    'Makefile': None,
+}
+# Order in which comprehensive_repo_analysis reports detected technologies
+_REPO_TECHNOLOGIES = ("Python", "Jupyter Notebooks", "Node.js/JavaScript", "Docker")
+
 async def comprehensive_repo_analysis(repo_url: str, github_token: str, github_repository: str) -> str:
     """Perform comprehensive repository analysis to understand architecture and technology stack."""
     try:
-        headers = {"Authorization": f"token {github_token}", "Accept": "application/vnd.github.v3+json"}
-        
-        # Get repository information
-        repo_response = requests.get(f"https://api.github.com/repos/{github_repository}", headers=headers)
+        # Get repository information and root-level contents concurrently
+        client = _github_client(github_token)
+        repo_response, (contents_status, contents) = await asyncio.gather(
+            _github_get(client, f"https://api.github.com/repos/{github_repository}"),
+            _list_directory(client, github_repository),
+        )
         if repo_response.status_code != 200:
             return f"Error accessing repository: {repo_response.status_code}"
         
         repo_info = repo_response.json()
         
-        # Get repository contents (root level)
-        contents_response = requests.get(f"https://api.github.com/repos/{github_repository}/contents", headers=headers)
-        if contents_response.status_code != 200:
-            return f"Error accessing repository contents: {contents_response.status_code}"
-        
-        contents = contents_response.json()
+        if contents_status != 200:
+            return f"Error accessing repository contents: {contents_status}"
         
         # Analyze file structure
-        analysis = f"# Repository Analysis: {github_repository}\n\n"
-        analysis += f"**Description**: {repo_info.get('description', 'No description')}\n"
-        analysis += f"**Language**: {repo_info.get('language', 'Not specified')}\n"
-        analysis += f"**Size**: {repo_info.get('size', 0)} KB\n\n"
+        parts = [f"# Repository Analysis: {github_repository}\n\n"]
+        parts.append(f"**Description**: {repo_info.get('description', 'No description')}\n")
+        parts.append(f"**Language**: {repo_info.get('language', 'Not specified')}\n")
+        parts.append(f"**Size**: {repo_info.get('size', 0)} KB\n\n")
         
         # Categorize files by type
         config_files = []
@@ -58,47 +372,46 @@ async def comprehensive_repo_analysis(repo_url: str, github_token: str, github_r
         documentation = []
         notebooks = []
         directories = []
+        technologies = set()
         
+        # Categorize and detect technologies in the same pass. Known config file names are checked
+        # before suffixes so requirements.txt isn't filed as documentation.
         for item in contents:
             name = item['name']
             if item['type'] == 'dir':
                 directories.append(name)
-            elif name.endswith(('.py', '.js', '.ts', '.java', '.cpp', '.c', '.go', '.rs', '.rb')):
+            elif name in _REPO_CONFIG_FILES:
+                config_files.append(name)
+                if _REPO_CONFIG_FILES[name]:
+                    technologies.add(_REPO_CONFIG_FILES[name])
+            elif (extension := _file_extension(name)) in _SOURCE_EXTENSIONS:
                 source_files.append(name)
-            elif name.endswith(('.ipynb',)):
+                if extension == 'py':
+                    technologies.add("Python")
+            elif extension == 'ipynb':
                 notebooks.append(name)
-            elif name.endswith(('.md', '.txt', '.rst', '.doc')):
+                technologies.add("Jupyter Notebooks")
+            elif extension in _DOCUMENTATION_EXTENSIONS:
                 documentation.append(name)
-            elif name in ['requirements.txt', 'package.json', 'pyproject.toml', 'setup.py', 'Dockerfile', '.gitignore', 'Makefile']:
-                config_files.append(name)
         
-        analysis += "## Project Structure:\n"
+        parts.append("## Project Structure:\n")
         if directories:
-            analysis += f"**Directories**: {', '.join(directories)}\n"
+            parts.append(f"**Directories**: {', '.join(directories)}\n")
         if source_files:
-            analysis += f"**Source Files**: {', '.join(source_files)}\n"
+            parts.append(f"**Source Files**: {', '.join(source_files)}\n")
         if notebooks:
-            analysis += f"**Jupyter Notebooks**: {', '.join(notebooks)}\n"
+            parts.append(f"**Jupyter Notebooks**: {', '.join(notebooks)}\n")
         if config_files:
-            analysis += f"**Configuration Files**: {', '.join(config_files)}\n"
+            parts.append(f"**Configuration Files**: {', '.join(config_files)}\n")
         if documentation:
-            analysis += f"**Documentation**: {', '.join(documentation)}\n"
+            parts.append(f"**Documentation**: {', '.join(documentation)}\n")
         
-        # Detect technology stack
-        tech_indicators = []
-        if any(f.endswith('.py') for f in source_files) or 'requirements.txt' in config_files or 'pyproject.toml' in config_files:
-            tech_indicators.append("Python")
-        if notebooks:
-            tech_indicators.append("Jupyter Notebooks")
-        if 'package.json' in config_files:
-            tech_indicators.append("Node.js/JavaScript")
-        if 'Dockerfile' in config_files:
-            tech_indicators.append("Docker")
+        tech_indicators = [technology for technology in _REPO_TECHNOLOGIES if technology in technologies]
         
         if tech_indicators:
-            analysis += f"\n**Detected Technologies**: {', '.join(tech_indicators)}\n"
+            parts.append(f"\n**Detected Technologies**: {', '.join(tech_indicators)}\n")
         
-        return analysis
+        return "".join(parts)
         
     except Exception as e:
         return f"Error during repository analysis: {str(e)}"
@@ -106,61 +419,53 @@ async def comprehensive_repo_analysis(repo_url: str, github_token: str, github_r
 async def smart_file_reader(github_token: str, github_repository: str, file_path: str) -> str:
     """Read a file with intelligent context and analysis."""
     try:
-        headers = {"Authorization": f"token {github_token}", "Accept": "application/vnd.github.v3+json"}
-        
         # Get file content
-        file_response = requests.get(f"https://api.github.com/repos/{github_repository}/contents/{file_path}", headers=headers)
+        client = _github_client(github_token)
+        file_response = await _github_get_file(client, github_repository, file_path)
         if file_response.status_code != 200:
             return f"Error reading file {file_path}: {file_response.status_code}"
         
-        file_data = file_response.json()
-        
-        if file_data.get('type') != 'file':
+        # Directories still come back as a JSON listing, even when asking for raw content
+        if _is_directory_listing(file_response):
             return f"{file_path} is not a file"
         
-        # Decode file content
-        content = base64.b64decode(file_data['content']).decode('utf-8')
+        content = file_response.text
         
         # Provide context based on file type
         file_ext = file_path.split('.')[-1].lower() if '.' in file_path else ''
-        analysis = f"# File Analysis: {file_path}\n\n"
+        parts = [f"# File Analysis: {file_path}\n\n", _truncation_note(file_response, file_path)]
         
         if file_ext == 'py':
-            analysis += "**Type**: Python source file\n"
+            parts.append("**Type**: Python source file\n")
             # Analyze Python imports and structure
-            lines = content.split('\n')
-            imports = [line.strip() for line in lines if line.strip().startswith(('import ', 'from '))]
-            classes = [line.strip() for line in lines if line.strip().startswith('class ')]
-            functions = [line.strip() for line in lines if line.strip().startswith('def ')]
+            imports, classes, functions = _scan_python_structure(content)
             
             if imports:
-                analysis += f"**Imports** ({len(imports)}): {', '.join(imports[:5])}{'...' if len(imports) > 5 else ''}\n"
+                parts.append(f"**Imports** ({len(imports)}): {', '.join(imports[:5])}{'...' if len(imports) > 5 else ''}\n")
             if classes:
-                analysis += f"**Classes** ({len(classes)}): {', '.join([c.split('(')[0].replace('class ', '') for c in classes[:3]])}{'...' if len(classes) > 3 else ''}\n"
+                parts.append(f"**Classes** ({len(classes)}): {', '.join(classes[:3])}{'...' if len(classes) > 3 else ''}\n")
             if functions:
-                analysis += f"**Functions** ({len(functions)}): {', '.join([f.split('(')[0].replace('def ', '') for f in functions[:5]])}{'...' if len(functions) > 5 else ''}\n"
+                parts.append(f"**Functions** ({len(functions)}): {', '.join(functions[:5])}{'...' if len(functions) > 5 else ''}\n")
         
         elif file_ext == 'ipynb':
-            analysis += "**Type**: Jupyter Notebook\n"
-            try:
-                notebook = json.loads(content)
-                cells = notebook.get('cells', [])
-                code_cells = [c for c in cells if c.get('cell_type') == 'code']
-                markdown_cells = [c for c in cells if c.get('cell_type') == 'markdown']
-                analysis += f"**Total Cells**: {len(cells)} (Code: {len(code_cells)}, Markdown: {len(markdown_cells)})\n"
-            except:
-                analysis += "**Note**: Could not parse notebook structure\n"
+            parts.append("**Type**: Jupyter Notebook\n")
+            # Count cell types without parsing the whole notebook, whose outputs can be megabytes of base64
+            if content.lstrip().startswith('{'):
+                cell_types = Counter(_NOTEBOOK_CELL_TYPE_PATTERN.findall(content))
+                parts.append(f"**Total Cells**: {sum(cell_types.values())} (Code: {cell_types['code']}, Markdown: {cell_types['markdown']})\n")
+            else:
+                parts.append("**Note**: Could not parse notebook structure\n")
         
         elif file_path.lower() in ['readme.md', 'readme.txt', 'readme.rst']:
-            analysis += "**Type**: Project README/Documentation\n"
+            parts.append("**Type**: Project README/Documentation\n")
         
         elif file_path in ['requirements.txt', 'pyproject.toml', 'setup.py']:
-            analysis += "**Type**: Python dependency/configuration file\n"
+            parts.append("**Type**: Python dependency/configuration file\n")
         
-        analysis += f"\n**File Size**: {len(content)} characters\n"
-        analysis += f"\n## File Content:\n```{file_ext}\n{content}\n```"
+        parts.append(f"\n**File Size**: {len(content)} characters\n")
+        parts.append(f"\n## File Content:\n```{file_ext}\n{content}\n```")
         
-        return analysis
+        return "".join(parts)
         
     except Exception as e:
         return f"Error reading file {file_path}: {str(e)}"
@@ -168,17 +473,17 @@ async def smart_file_reader(github_token: str, github_repository: str, file_path
 async def intelligent_code_search(github_token: str, github_repository: str, query: str, file_extension: str = "") -> str:
     """Search for code patterns with intelligent context."""
     try:
-        headers = {"Authorization": f"token {github_token}", "Accept": "application/vnd.github.v3+json"}
-        
         # Build search query
         search_query = f"{query} repo:{github_repository}"
         if file_extension:
             search_query += f" extension:{file_extension}"
         
         # Use GitHub search API
-        search_response = requests.get(
-            f"https://api.github.com/search/code?q={requests.utils.quote(search_query)}&per_page=10",
-            headers=headers
+        client = _github_client(github_token)
+        search_response = await _github_get(
+            client,
+            "https://api.github.com/search/code",
+            params={"q": search_query, "per_page": 10}
         )
         
         if search_response.status_code != 200:
@@ -189,19 +494,19 @@ async def intelligent_code_search(github_token: str, github_repository: str, que
         if search_results['total_count'] == 0:
             return f"No code found matching '{query}'"
         
-        analysis = f"# Code Search Results for '{query}'\n\n"
-        analysis += f"**Total matches**: {search_results['total_count']}\n\n"
+        parts = [f"# Code Search Results for '{query}'\n\n"]
+        parts.append(f"**Total matches**: {search_results['total_count']}\n\n")
         
         for i, item in enumerate(search_results['items'][:5], 1):
-            analysis += f"## Result {i}: {item['name']}\n"
-            analysis += f"**Path**: {item['path']}\n"
-            analysis += f"**Repository**: {item['repository']['full_name']}\n"
+            parts.append(f"## Result {i}: {item['name']}\n")
+            parts.append(f"**Path**: {item['path']}\n")
+            parts.append(f"**Repository**: {item['repository']['full_name']}\n")
             if 'text_matches' in item:
                 for match in item['text_matches'][:2]:
-                    analysis += f"**Match**: ...{match.get('fragment', 'N/A')}...\n"
-            analysis += "\n"
+                    parts.append(f"**Match**: ...{match.get('fragment', 'N/A')}...\n")
+            parts.append("\n")
         
-        return analysis
+        return "".join(parts)
         
     except Exception as e:
         return f"Error during code search: {str(e)}"
@@ -209,24 +514,6 @@ async def intelligent_code_search(github_token: str, github_repository: str, que
 async def detect_tech_stack(github_token: str, github_repository: str) -> str:
     """Detect and analyze the technology stack used in the repository."""
     try:
-        headers = {"Authorization": f"token {github_token}", "Accept": "application/vnd.github.v3+json"}
-        
-        # Get languages used in the repository
-        languages_response = requests.get(f"https://api.github.com/repos/{github_repository}/languages", headers=headers)
-        if languages_response.status_code == 200:
-            languages = languages_response.json()
-        else:
-            languages = {}
-        
-        analysis = f"# Technology Stack Analysis: {github_repository}\n\n"
-        
-        if languages:
-            total_bytes = sum(languages.values())
-            analysis += "## Programming Languages:\n"
-            for lang, bytes_count in sorted(languages.items(), key=lambda x: x[1], reverse=True):
-                percentage = (bytes_count / total_bytes) * 100
-                analysis += f"- **{lang}**: {percentage:.1f}% ({bytes_count:,} bytes)\n"
-        
         # Check for specific framework/library indicators
         config_files_to_check = [
             ('requirements.txt', 'Python dependencies'),
@@ -241,13 +528,35 @@ async def detect_tech_stack(github_token: str, github_repository: str) -> str:
             ('pipfile', 'Pipenv dependencies')
         ]
         
-        analysis += "\n## Detected Configuration Files:\n"
-        for file_path, description in config_files_to_check:
-            file_response = requests.get(f"https://api.github.com/repos/{github_repository}/contents/{file_path}", headers=headers)
+        # Fetch the language breakdown and probe every config file concurrently
+        client = _github_client(github_token)
+        languages_response, *file_responses = await asyncio.gather(
+            _github_get(client, f"https://api.github.com/repos/{github_repository}/languages"),
+            *(
+                _github_get_file(client, github_repository, file_path)
+                for file_path, _ in config_files_to_check
+            ),
+        )
+        if languages_response.status_code == 200:
+            languages = languages_response.json()
+        else:
+            languages = {}
+        
+        parts = [f"# Technology Stack Analysis: {github_repository}\n\n"]
+        
+        if languages:
+            total_bytes = sum(languages.values())
+            parts.append("## Programming Languages:\n")
+            for lang, bytes_count in sorted(languages.items(), key=lambda x: x[1], reverse=True):
+                percentage = (bytes_count / total_bytes) * 100
+                parts.append(f"- **{lang}**: {percentage:.1f}% ({bytes_count:,} bytes)\n")
+        
+        parts.append("\n## Detected Configuration Files:\n")
+        for (file_path, description), file_response in zip(config_files_to_check, file_responses):
             if file_response.status_code == 200:
-                analysis += f"- **{file_path}**: {description}\n"
+                parts.append(f"- **{file_path}**: {description}\n")
         
-        return analysis
+        return "".join(parts)
         
     except Exception as e:
         return f"Error detecting technology stack: {str(e)}"
@@ -255,9 +564,7 @@ async def detect_tech_stack(github_token: str, github_repository: str) -> str:
 async def analyze_config_files(github_token: str, github_repository: str) -> str:
     """Analyze project configuration files to understand dependencies and setup."""
     try:
-        headers = {"Authorization": f"token {github_token}", "Accept": "application/vnd.github.v3+json"}
-        
-        analysis = f"# Configuration Files Analysis: {github_repository}\n\n"
+        parts = [f"# Configuration Files Analysis: {github_repository}\n\n"]
         
         # Check key configuration files
         config_files = [
@@ -269,38 +576,43 @@ async def analyze_config_files(github_token: str, github_repository: str) -> str
             'Dockerfile'
         ]
         
-        for config_file in config_files:
-            file_response = requests.get(f"https://api.github.com/repos/{github_repository}/contents/{config_file}", headers=headers)
+        client = _github_client(github_token)
+        file_responses = await asyncio.gather(*(
+            _github_get_file(client, github_repository, config_file)
+            for config_file in config_files
+        ))
+        
+        for config_file, file_response in zip(config_files, file_responses):
             if file_response.status_code == 200:
-                file_data = file_response.json()
-                content = base64.b64decode(file_data['content']).decode('utf-8')
+                content = file_response.text
                 
-                analysis += f"## {config_file}\n"
+                parts.append(f"## {config_file}\n")
+                parts.append(_truncation_note(file_response, config_file))
                 
                 if config_file == 'requirements.txt':
                     deps = [line.strip() for line in content.split('\n') if line.strip() and not line.startswith('#')]
-                    analysis += f"**Python Dependencies** ({len(deps)}): {', '.join(deps[:10])}{'...' if len(deps) > 10 else ''}\n\n"
+                    parts.append(f"**Python Dependencies** ({len(deps)}): {', '.join(deps[:10])}{'...' if len(deps) > 10 else ''}\n\n")
                 
                 elif config_file == 'pyproject.toml':
-                    analysis += "**Python Project Configuration**\n"
-                    analysis += f"```toml\n{content[:500]}{'...' if len(content) > 500 else ''}\n```\n\n"
+                    parts.append("**Python Project Configuration**\n")
+                    parts.append(f"```toml\n{content[:500]}{'...' if len(content) > 500 else ''}\n```\n\n")
                 
                 elif config_file == 'package.json':
                     try:
                         package_data = json.loads(content)
-                        analysis += f"**Project Name**: {package_data.get('name', 'N/A')}\n"
-                        analysis += f"**Version**: {package_data.get('version', 'N/A')}\n"
+                        parts.append(f"**Project Name**: {package_data.get('name', 'N/A')}\n")
+                        parts.append(f"**Version**: {package_data.get('version', 'N/A')}\n")
                         if 'dependencies' in package_data:
                             deps = list(package_data['dependencies'].keys())
-                            analysis += f"**Dependencies**: {', '.join(deps[:10])}{'...' if len(deps) > 10 else ''}\n"
+                            parts.append(f"**Dependencies**: {', '.join(deps[:10])}{'...' if len(deps) > 10 else ''}\n")
                     except:
-                        analysis += "**Note**: Could not parse package.json\n"
-                    analysis += "\n"
+                        parts.append("**Note**: Could not parse package.json\n")
+                    parts.append("\n")
                 
                 else:
-                    analysis += f"```\n{content[:300]}{'...' if len(content) > 300 else ''}\n```\n\n"
+                    parts.append(f"```\n{content[:300]}{'...' if len(content) > 300 else ''}\n```\n\n")
         
-        return analysis
+        return "".join(parts)
         
     except Exception as e:
         return f"Error analyzing configuration files: {str(e)}"
@@ -308,20 +620,13 @@ async def analyze_config_files(github_token: str, github_repository: str) -> str
 async def explore_directory_structure(github_token: str, github_repository: str, directory_path: str = "") -> str:
     """Explore a specific directory to understand its organization."""
     try:
-        headers = {"Authorization": f"token {github_token}", "Accept": "application/vnd.github.v3+json"}
-        
         # Get directory contents
-        url = f"https://api.github.com/repos/{github_repository}/contents"
-        if directory_path:
-            url += f"/{directory_path.rstrip('/')}"
-        
-        dir_response = requests.get(url, headers=headers)
-        if dir_response.status_code != 200:
-            return f"Error accessing directory {directory_path or 'root'}: {dir_response.status_code}"
+        client = _github_client(github_token)
+        dir_status, contents = await _list_directory(client, github_repository, directory_path)
+        if dir_status != 200:
+            return f"Error accessing directory {directory_path or 'root'}: {dir_status}"
         
-        contents = dir_response.json()
-        
-        analysis = f"# Directory Structure: {directory_path or 'Root Directory'}\n\n"
+        parts = [f"# Directory Structure: {directory_path or 'Root Directory'}\n\n"]
         
         # Categorize contents
         directories = []
@@ -334,27 +639,27 @@ async def explore_directory_structure(github_token: str, github_repository: str,
             name = item['name']
             if item['type'] == 'dir':
                 directories.append(name)
-            elif name.endswith('.py'):
+            elif (extension := _file_extension(name)) == 'py':
                 python_files.append(name)
-            elif name.endswith('.ipynb'):
+            elif extension == 'ipynb':
                 notebooks.append(name)
-            elif name in ['requirements.txt', 'setup.py', 'pyproject.toml', '.gitignore', 'Dockerfile', 'README.md']:
+            elif name in _DIRECTORY_CONFIG_FILES:
                 config_files.append(name)
             else:
                 other_files.append(name)
         
         if directories:
-            analysis += f"**Subdirectories** ({len(directories)}): {', '.join(directories)}\n"
+            parts.append(f"**Subdirectories** ({len(directories)}): {', '.join(directories)}\n")
         if python_files:
-            analysis += f"**Python Files** ({len(python_files)}): {', '.join(python_files)}\n"
+            parts.append(f"**Python Files** ({len(python_files)}): {', '.join(python_files)}\n")
         if notebooks:
-            analysis += f"**Jupyter Notebooks** ({len(notebooks)}): {', '.join(notebooks)}\n"
+            parts.append(f"**Jupyter Notebooks** ({len(notebooks)}): {', '.join(notebooks)}\n")
         if config_files:
-            analysis += f"**Configuration Files** ({len(config_files)}): {', '.join(config_files)}\n"
+            parts.append(f"**Configuration Files** ({len(config_files)}): {', '.join(config_files)}\n")
         if other_files:
-            analysis += f"**Other Files** ({len(other_files)}): {', '.join(other_files[:10])}{'...' if len(other_files) > 10 else ''}\n"
+            parts.append(f"**Other Files** ({len(other_files)}): {', '.join(other_files[:10])}{'...' if len(other_files) > 10 else ''}\n")
         
-        return analysis
+        return "".join(parts)
         
     except Exception as e:
         return f"Error exploring directory: {str(e)}"
@@ -362,9 +667,7 @@ async def explore_directory_structure(github_token: str, github_repository: str,
 async def analyze_dependencies_and_imports(github_token: str, github_repository: str) -> str:
     """Analyze dependencies, imports, and module relationships in the codebase."""
     try:
-        headers = {"Authorization": f"token {github_token}", "Accept": "application/vnd.github.v3+json"}
-        
-        analysis = f"# Dependency Graph Analysis: {github_repository}\n\n"
+        parts = [f"# Dependency Graph Analysis: {github_repository}\n\n"]
         
         # Search for Python import patterns
         import_patterns = [
@@ -380,31 +683,40 @@ async def analyze_dependencies_and_imports(github_token: str, github_repository:
         
         dependency_map = {}
         
-        for pattern in import_patterns:
-            search_response = requests.get(
-                f"https://api.github.com/search/code?q={requests.utils.quote(f'{pattern} repo:{github_repository}')}&per_page=10",
-                headers=headers
-            )
-            
+        # Run the searches concurrently, bounded so we don't trip the search API's secondary limits
+        search_semaphore = asyncio.Semaphore(GITHUB_SEARCH_CONCURRENCY)
+        client = _github_client(github_token)
+        
+        async def bounded_search(pattern: str) -> httpx.Response:
+            async with search_semaphore:
+                return await _github_get(
+                    client,
+                    "https://api.github.com/search/code",
+                    params={"q": f"{pattern} repo:{github_repository}", "per_page": 10}
+                )
+        
+        search_responses = await asyncio.gather(*(bounded_search(pattern) for pattern in import_patterns))
+        
+        for pattern, search_response in zip(import_patterns, search_responses):
             if search_response.status_code == 200:
                 results = search_response.json()
                 if results['total_count'] > 0:
-                    analysis += f"## {pattern} Dependencies\n"
+                    parts.append(f"## {pattern} Dependencies\n")
                     for item in results['items'][:3]:
                         file_path = item['path']
                         if file_path not in dependency_map:
                             dependency_map[file_path] = []
                         dependency_map[file_path].append(pattern)
-                        analysis += f"- **{file_path}**: Uses {pattern}\n"
-                    analysis += "\n"
+                        parts.append(f"- **{file_path}**: Uses {pattern}\n")
+                    parts.append("\n")
         
         # Analyze key architectural patterns
-        analysis += "## Architectural Dependencies\n"
+        parts.append("## Architectural Dependencies\n")
         for file_path, deps in dependency_map.items():
             if len(deps) > 1:
-                analysis += f"- **{file_path}**: Central component using {', '.join(deps)}\n"
+                parts.append(f"- **{file_path}**: Central component using {', '.join(deps)}\n")
         
-        return analysis
+        return "".join(parts)
         
     except Exception as e:
         return f"Error analyzing dependencies: {str(e)}"
@@ -412,9 +724,7 @@ async def analyze_dependencies_and_imports(github_token: str, github_repository:
 async def trace_execution_flow(github_token: str, github_repository: str, entry_point: str) -> str:
     """Trace code execution flow from a starting point."""
     try:
-        headers = {"Authorization": f"token {github_token}", "Accept": "application/vnd.github.v3+json"}
-        
-        analysis = f"# Code Flow Analysis: {entry_point}\n\n"
+        parts = [f"# Code Flow Analysis: {entry_point}\n\n"]
         
         # Extract file and function/class from entry point
         if ":" in entry_point:
@@ -424,21 +734,22 @@ async def trace_execution_flow(github_token: str, github_repository: str, entry_
             target = None
         
         # Read the entry point file
-        file_response = requests.get(f"https://api.github.com/repos/{github_repository}/contents/{file_path}", headers=headers)
+        client = _github_client(github_token)
+        file_response = await _github_get_file(client, github_repository, file_path)
         if file_response.status_code == 200:
-            file_data = file_response.json()
-            content = base64.b64decode(file_data['content']).decode('utf-8')
+            content = file_response.text
             
-            analysis += f"## Starting Point: {file_path}\n"
+            parts.append(f"## Starting Point: {file_path}\n")
+            parts.append(_truncation_note(file_response, file_path))
             
             # Find function calls and imports
             lines = content.split('\n')
-            imports = [line.strip() for line in lines if line.strip().startswith(('import ', 'from '))]
+            imports, _, _ = _scan_python_structure(content)
+            target_lines = []
             
             if target:
                 # Find the specific function/class
                 in_target = False
-                target_lines = []
                 for line in lines:
                     if f"def {target}" in line or f"class {target}" in line:
                         in_target = True
@@ -448,12 +759,12 @@ async def trace_execution_flow(github_token: str, github_repository: str, entry_
                     if in_target:
                         target_lines.append(line)
                 
-                analysis += f"### Function/Class: {target}\n"
-                analysis += f"```python\n" + "\n".join(target_lines[:10]) + "\n```\n\n"
+                parts.append(f"### Function/Class: {target}\n")
+                parts.append(f"```python\n" + "\n".join(target_lines[:10]) + "\n```\n\n")
             
-            analysis += f"### Imports in {file_path}\n"
+            parts.append(f"### Imports in {file_path}\n")
             for imp in imports[:5]:
-                analysis += f"- {imp}\n"
+                parts.append(f"- {imp}\n")
             
             # Search for function calls within the target
             if target_lines:
@@ -461,21 +772,33 @@ async def trace_execution_flow(github_token: str, github_repository: str, entry_
                 for line in target_lines:
                     # Simple pattern matching for function calls
                     if "(" in line and ")" in line:
-                        # Extract potential function calls
-                        import re
-                        calls = re.findall(r'(\w+)\(', line)
-                        function_calls.extend(calls)
+                        function_calls.extend(_FUNCTION_CALL_PATTERN.findall(line))
                 
                 if function_calls:
-                    analysis += f"\n### Function Calls in {target}\n"
-                    for call in set(function_calls)[:5]:
-                        analysis += f"- {call}()\n"
+                    parts.append(f"\n### Function Calls in {target}\n")
+                    # Deduplicate while keeping first-seen order
+                    for call in islice(dict.fromkeys(function_calls), 5):
+                        parts.append(f"- {call}()\n")
         
-        return analysis
+        return "".join(parts)
         
     except Exception as e:
         return f"Error tracing code flow: {str(e)}"
 
+@functools.lru_cache(maxsize=32)
+def parse_github_repository(repo_url: str) -> Optional[str]:
+    """Extract "owner/repo" from a GitHub URL, ignoring any .git suffix, query or fragment."""
+    repo_url = repo_url.strip()
+    if "://" not in repo_url:
+        repo_url = f"https://{repo_url}"
+    url_parts = urlsplit(repo_url)
+    if url_parts.netloc.lower() not in ("github.com", "www.github.com"):
+        return None
+    path_parts = url_parts.path.strip("/").split("/")
+    if len(path_parts) < 2 or not path_parts[0] or not path_parts[1].removesuffix(".git"):
+        return None
+    return f"{path_parts[0]}/{path_parts[1].removesuffix('.git')}"
+
 async def get_github_tools(config: RunnableConfig):
     """Get enhanced GitHub tools for comprehensive repository analysis."""
     try:
@@ -483,13 +806,7 @@ async def get_github_tools(config: RunnableConfig):
         repo_url = config.get("configurable", {}).get("github_repo_url", "")
         github_token = config.get("configurable", {}).get("github_access_token", "")
         
-        # Extract owner/repo from URL
-        github_repository = None
-        if "github.com/" in repo_url:
-            parts = repo_url.replace("https://github.com/", "").replace("http://github.com/", "").split("/")
-            if len(parts) >= 2:
-                owner, repo = parts[0], parts[1]
-                github_repository = f"{owner}/{repo}"
+        github_repository = parse_github_repository(repo_url)
         
         if not github_repository or not github_token:
             logging.warning("GitHub repository or token not configured properly")
@@ -586,13 +903,9 @@ async def get_github_tools(config: RunnableConfig):
 async def analyze_repository_structure(repo_url: str, config: RunnableConfig) -> str:
     """Analyze the basic structure of a GitHub repository."""
     try:
-        # Extract owner/repo from URL
         if "github.com/" in repo_url:
-            parts = repo_url.replace("https://github.com/", "").replace("http://github.com/", "").split("/")
-            if len(parts) >= 2:
-                owner, repo = parts[0], parts[1]
-                repo_identifier = f"{owner}/{repo}"
-                
+            repo_identifier = parse_github_repository(repo_url)
+            if repo_identifier:
                 # Set environment variable for GitHub toolkit
                 os.environ["GITHUB_REPOSITORY"] = repo_identifier
                 
@@ -609,37 +922,44 @@ async def analyze_repository_structure(repo_url: str, config: RunnableConfig) ->
 async def clone_repository(repo_url: str, target_dir: str = "/tmp/repo_analysis") -> str:
     """Clone a GitHub repository for local analysis."""
     try:
-        import subprocess
         import shutil
         
-        # Clean up existing directory
+        # Clean up existing directory off the event loop
         if os.path.exists(target_dir):
-            shutil.rmtree(target_dir)
-        
-        # Clone the repository
-        result = subprocess.run(
-            ["git", "clone", repo_url, target_dir],
-            capture_output=True,
-            text=True,
-            timeout=300  # 5 minute timeout
-        )
+            await asyncio.to_thread(shutil.rmtree, target_dir)
         
-        if result.returncode == 0:
+        # Shallow, blobless clone: only HEAD's history and the files it checks out are downloaded
+        process = await asyncio.create_subprocess_exec(
+            "git", "clone", "--depth=1", "--filter=blob:none", repo_url, target_dir,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout=300)  # 5 minute timeout
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise
+        
+        if process.returncode == 0:
             return f"Successfully cloned repository to {target_dir}"
         else:
-            return f"Failed to clone repository: {result.stderr}"
+            return f"Failed to clone repository: {stderr.decode(errors='replace')}"
             
     except Exception as e:
         logging.error(f"Error cloning repository: {e}")
         return f"Error cloning repository: {str(e)}"
 
-async def summarize_code_analysis(model: BaseChatModel, analysis_content: str) -> str:
-    """Summarize code analysis results."""
+async def summarize_code_analysis(model: BaseChatModel, analysis_content: str, max_input_tokens: int = 8000) -> str:
+    """Summarize code analysis results, streaming the response so a timeout still keeps what arrived."""
+    summary = None
     try:
+        # Rough chars-per-token estimate; oversized analyses would otherwise overflow the context window
+        truncated_content = analysis_content[:max_input_tokens * 4]
         summary_prompt = f"""
         Analyze the following code/repository information and provide a concise summary:
         
-        {analysis_content}
+        {truncated_content}
         
         Please provide:
         1. Key architectural patterns identified
@@ -650,15 +970,19 @@ async def summarize_code_analysis(model: BaseChatModel, analysis_content: str) -
         Format as a structured summary.
         """
         
-        summary = await asyncio.wait_for(
-            model.ainvoke([HumanMessage(content=summary_prompt)]),
-            timeout=60.0
-        )
+        async def collect_summary():
+            nonlocal summary
+            async for chunk in model.astream([HumanMessage(content=summary_prompt)]):
+                summary = chunk if summary is None else summary + chunk
+        
+        await asyncio.wait_for(collect_summary(), timeout=60.0)
         
-        return f"<summary>\n{summary.content}\n</summary>"
+        return f"<summary>\n{summary.content if summary is not None else ''}\n</summary>"
         
     except (asyncio.TimeoutError, Exception) as e:
         logging.error(f"Failed to summarize code analysis: {str(e)}")
+        if summary is not None and summary.content:
+            return f"<summary>\n{summary.content}\n</summary>"
         return analysis_content
 
 
@@ -668,7 +992,35 @@ async def summarize_code_analysis(model: BaseChatModel, analysis_content: str) -
 ##########################
 # Tool Utils
 ##########################
+# Tool lists keyed by (repo URL, token). Each entry is the task that builds the list, so concurrent
+# analyzers asking for the same tools share a single build.
+_TOOLS_CACHE_SIZE = 32
+_tools_cache: "OrderedDict[tuple[str, str], asyncio.Future]" = OrderedDict()
+
 async def get_all_tools(config: RunnableConfig):
+    tools, _ = await _get_cached_tools(config)
+    return tools
+
+async def get_tools_by_name(config: RunnableConfig) -> Dict[str, Any]:
+    """Get the same tools as get_all_tools, indexed by tool name."""
+    _, tools_by_name = await _get_cached_tools(config)
+    return tools_by_name
+
+async def _get_cached_tools(config: RunnableConfig):
+    configurable = config.get("configurable", {})
+    cache_key = (configurable.get("github_repo_url", ""), configurable.get("github_access_token", ""))
+    tools_future = _tools_cache.get(cache_key)
+    if tools_future is None or (tools_future.done() and (tools_future.cancelled() or tools_future.exception())):
+        tools_future = asyncio.ensure_future(_build_all_tools(config))
+        _tools_cache[cache_key] = tools_future
+        if len(_tools_cache) > _TOOLS_CACHE_SIZE:
+            _tools_cache.popitem(last=False)
+    else:
+        _tools_cache.move_to_end(cache_key)
+    # Shield the shared build so one cancelled caller doesn't cancel it for everyone else
+    return await asyncio.shield(tools_future)
+
+async def _build_all_tools(config: RunnableConfig):
     # Create the AnalysisComplete tool
     analysis_complete_tool = StructuredTool.from_function(
         func=lambda: "Analysis completed",
@@ -682,86 +1034,190 @@ async def get_all_tools(config: RunnableConfig):
     github_tools = await get_github_tools(config)
     tools.extend(github_tools)
     
-    return tools
+    return tools, {_tool_name(tool): tool for tool in tools}
+
+def _tool_name(tool) -> str:
+    name = getattr(tool, "name", None)
+    if name:
+        return name
+    return tool.get("name", "github_analysis") if isinstance(tool, dict) else "github_analysis"
+
+async def ainvoke_structured(model, schema: type[BaseModel], messages: list[MessageLikeRepresentation], max_retries: int = 3):
+    """Get a schema instance from a single forced tool call.
+
+    Transport errors are retried as before. When the arguments don't validate, the model is re-asked with the
+    validation error, so the retry can correct itself instead of replaying a cached response.
+    """
+    max_retries = max(1, max_retries)
+    structured_model = model.bind_tools([schema], tool_choice=schema.__name__).with_retry(stop_after_attempt=max_retries)
+    messages = list(messages)
+    for attempt in range(max_retries):
+        response = await structured_model.ainvoke(messages)
+        try:
+            if not response.tool_calls:
+                if response.invalid_tool_calls:
+                    raise ValueError(f"Malformed {schema.__name__} arguments: {response.invalid_tool_calls[0].get('error') or 'could not parse them'}")
+                raise ValueError(f"No {schema.__name__} tool call in the response")
+            return schema.model_validate(response.tool_calls[0]["args"])
+        except ValueError as e:
+            if attempt == max_retries - 1:
+                raise
+            # Providers reject a tool call without a matching tool result, and malformed calls are sent back
+            # as tool calls too, so every call gets an error result, or the response is left out entirely
+            answered_calls = [*response.tool_calls, *response.invalid_tool_calls]
+            if answered_calls and all(tool_call.get("id") for tool_call in answered_calls):
+                messages.append(response)
+                messages.extend(ToolMessage(
+                    content=f"Error: {e}. Call {schema.__name__} again with corrected arguments.",
+                    name=tool_call.get("name") or schema.__name__,
+                    tool_call_id=tool_call["id"]
+                ) for tool_call in answered_calls)
+            else:
+                messages.append(HumanMessage(content=f"Error: {e}. Call the {schema.__name__} tool."))
+
+def normalize_analysis_topic(topic: str) -> str:
+    """Key for spotting duplicate analysis topics: lowercase words with punctuation and extra spacing removed."""
+    return " ".join(re.findall(r"\w+", topic.lower()))
 
 def get_notes_from_tool_calls(messages: list[MessageLikeRepresentation]):
-    return [tool_msg.content for tool_msg in filter_messages(messages, include_types="tool")]
+    return [message.content for message in messages if isinstance(message, ToolMessage)]
 
-def get_today_str() -> str:
-    """Get today's date as a string."""
-    return datetime.now().strftime("%Y-%m-%d")
+# Formatted dates keyed by format string, reused until the day changes
+_today_str_cache: dict[str, tuple[date, str]] = {}
+
+def _format_today(fmt: str) -> str:
+    today = date.today()
+    cached = _today_str_cache.get(fmt)
+    if cached is None or cached[0] != today:
+        cached = _today_str_cache[fmt] = (today, today.strftime(fmt))
+    return cached[1]
+
+def get_today_str(fmt: str = "%a %b %-d, %Y") -> str:
+    """Get today's date as a string, human-readable by default."""
+    return _format_today(fmt)
+
+# Serialized conversation prefixes keyed by (prefix length, id of the last message in the prefix)
+_BUFFER_STRING_CACHE_SIZE = 256
+_buffer_string_cache: "OrderedDict[tuple[int, str], str]" = OrderedDict()
+
+def buffered_string(messages: list[MessageLikeRepresentation], cache: Optional["OrderedDict[tuple[int, str], str]"] = None) -> str:
+    """get_buffer_string that only serializes the messages added since the last call for the same conversation."""
+    cache = _buffer_string_cache if cache is None else cache
+    message_ids = [getattr(message, "id", None) for message in messages]
+    # Reuse the longest prefix we've already serialized, as long as every message in it has a stable id
+    prefix_len = 0
+    prefix = ""
+    stable_len = next((i for i, message_id in enumerate(message_ids) if not message_id), len(message_ids))
+    for k in range(stable_len, 0, -1):
+        cached = cache.get((k, message_ids[k - 1]))
+        if cached is not None:
+            prefix_len, prefix = k, cached
+            cache.move_to_end((k, message_ids[k - 1]))
+            break
+    if prefix_len == len(messages):
+        return prefix
+    tail = get_buffer_string(messages[prefix_len:])
+    buffer = f"{prefix}\n{tail}" if prefix_len else tail
+    if stable_len == len(messages) and messages:
+        cache[(len(messages), message_ids[-1])] = buffer
+        if len(cache) > _BUFFER_STRING_CACHE_SIZE:
+            cache.popitem(last=False)
+    return buffer
 
 
 ##########################
 # Token Limit Exceeded Utils (keeping existing)
 ##########################
 def is_token_limit_exceeded(exception: Exception, model_name: str = None) -> bool:
-    error_str = str(exception).lower()
-    provider = None
-    if model_name:
-        model_str = str(model_name).lower()
-        if model_str.startswith('openai:'):
-            provider = 'openai'
-        elif model_str.startswith('anthropic:'):
-            provider = 'anthropic'
-        elif model_str.startswith('gemini:') or model_str.startswith('google:'):
-            provider = 'gemini'
+    # SDK errors can stringify whole request payloads, so only build the lowercased message
+    # once a check actually needs it, after the cheap attribute and class checks
+    error_str = None
+    
+    def get_error_str() -> str:
+        nonlocal error_str
+        if error_str is None:
+            error_str = str(exception).lower()
+        return error_str
+    
+    provider = _token_limit_provider(str(model_name)) if model_name else None
     if provider == 'openai':
-        return _check_openai_token_limit(exception, error_str)
+        return _check_openai_token_limit(exception, get_error_str)
     elif provider == 'anthropic':
-        return _check_anthropic_token_limit(exception, error_str)
+        return _check_anthropic_token_limit(exception, get_error_str)
     elif provider == 'gemini':
-        return _check_gemini_token_limit(exception, error_str)
+        return _check_gemini_token_limit(exception, get_error_str)
     
-    return (_check_openai_token_limit(exception, error_str) or
-            _check_anthropic_token_limit(exception, error_str) or
-            _check_gemini_token_limit(exception, error_str))
-
-def _check_openai_token_limit(exception: Exception, error_str: str) -> bool:
-    exception_type = str(type(exception))
-    class_name = exception.__class__.__name__
-    module_name = getattr(exception.__class__, '__module__', '')
-    is_openai_exception = ('openai' in exception_type.lower() or 
-                          'openai' in module_name.lower())
-    is_bad_request = class_name in ['BadRequestError', 'InvalidRequestError']
-    if is_openai_exception and is_bad_request:
-        token_keywords = ['token', 'context', 'length', 'maximum context', 'reduce']
-        if any(keyword in error_str for keyword in token_keywords):
-            return True
+    return (_check_openai_token_limit(exception, get_error_str) or
+            _check_anthropic_token_limit(exception, get_error_str) or
+            _check_gemini_token_limit(exception, get_error_str))
+
+# Model name prefixes (lowercased) for each provider's token-limit errors
+_OPENAI_PREFIXES = ("openai:",)
+_ANTHROPIC_PREFIXES = ("anthropic:",)
+_GEMINI_PREFIXES = ("gemini:", "google:", "google_genai:", "google_vertexai:")
+
+@functools.lru_cache(maxsize=64)
+def _token_limit_provider(model_name: str) -> Optional[str]:
+    model_str = model_name.lower()
+    if model_str.startswith(_OPENAI_PREFIXES):
+        return 'openai'
+    elif model_str.startswith(_ANTHROPIC_PREFIXES):
+        return 'anthropic'
+    elif model_str.startswith(_GEMINI_PREFIXES):
+        return 'gemini'
+    return None
+
+# (SDK provider or None, class name) per exception class. Weak keys so classes created on the fly
+# (e.g. by test doubles) aren't kept alive by the cache.
+_exception_class_info: "weakref.WeakKeyDictionary[type, tuple[Optional[str], str]]" = weakref.WeakKeyDictionary()
+
+# The first provider name appearing as a whole word of a module path, e.g. openai._exceptions
+# or langchain_google_genai.chat_models
+_EXCEPTION_PROVIDER_PATTERN = re.compile(r"(?:^|[._])(openai|anthropic|google)(?=$|[._])")
+
+def _classify_exception_class(exception_class: type) -> tuple[Optional[str], str]:
+    """Which SDK ('openai', 'anthropic', 'google' or None) an exception class comes from, plus its name; computed once per class."""
+    class_info = _exception_class_info.get(exception_class)
+    if class_info is None:
+        match = _EXCEPTION_PROVIDER_PATTERN.search((exception_class.__module__ or '').lower())
+        class_info = _exception_class_info[exception_class] = (match.group(1) if match else None, exception_class.__name__)
+    return class_info
+
+# Keywords in a lowercased OpenAI error message that point at the context window, matched in one scan
+_OPENAI_TOKEN_LIMIT_PATTERN = re.compile(r"token|context|length|reduce")
+
+def _check_openai_token_limit(exception: Exception, get_error_str: Callable[[], str]) -> bool:
     if hasattr(exception, 'code') and hasattr(exception, 'type'):
         if (getattr(exception, 'code', '') == 'context_length_exceeded' or
             getattr(exception, 'type', '') == 'invalid_request_error'):
             return True
+    sdk, class_name = _classify_exception_class(exception.__class__)
+    is_bad_request = class_name in ['BadRequestError', 'InvalidRequestError']
+    if sdk == 'openai' and is_bad_request:
+        if _OPENAI_TOKEN_LIMIT_PATTERN.search(get_error_str()):
+            return True
     return False
 
-def _check_anthropic_token_limit(exception: Exception, error_str: str) -> bool:
-    exception_type = str(type(exception))
-    class_name = exception.__class__.__name__
-    module_name = getattr(exception.__class__, '__module__', '')
-    is_anthropic_exception = ('anthropic' in exception_type.lower() or 
-                             'anthropic' in module_name.lower())
+def _check_anthropic_token_limit(exception: Exception, get_error_str: Callable[[], str]) -> bool:
+    sdk, class_name = _classify_exception_class(exception.__class__)
     is_bad_request = class_name == 'BadRequestError'
-    if is_anthropic_exception and is_bad_request:
-        if 'prompt is too long' in error_str:
+    if sdk == 'anthropic' and is_bad_request:
+        if 'prompt is too long' in get_error_str():
             return True
     return False
 
-def _check_gemini_token_limit(exception: Exception, error_str: str) -> bool:
-    exception_type = str(type(exception))
-    class_name = exception.__class__.__name__
-    module_name = getattr(exception.__class__, '__module__', '')
-    
-    is_google_exception = ('google' in exception_type.lower() or 'google' in module_name.lower())
+def _check_gemini_token_limit(exception: Exception, get_error_str: Callable[[], str]) -> bool:
+    sdk, class_name = _classify_exception_class(exception.__class__)
+    # Covers google.api_core.exceptions.ResourceExhausted as well as the Generative AI fetch error
     is_resource_exhausted = class_name in ['ResourceExhausted', 'GoogleGenerativeAIFetchError']
-    if is_google_exception and is_resource_exhausted:
-        return True
-    if 'google.api_core.exceptions.resourceexhausted' in exception_type.lower():
+    if sdk == 'google' and is_resource_exhausted:
         return True
     
     return False
 
 # NOTE: This may be out of date or not applicable to your models. Please update this as needed.
-MODEL_TOKEN_LIMITS = {
+# Read-only: _MODEL_TOKEN_LIMIT_TRIE is built from it at import, so later edits wouldn't take effect.
+MODEL_TOKEN_LIMITS = MappingProxyType({
     "openai:gpt-4.1-mini": 1047576,
     "openai:gpt-4.1-nano": 1047576,
     "openai:gpt-4.1": 1047576,
@@ -794,13 +1250,78 @@ MODEL_TOKEN_LIMITS = {
     "ollama:llama2:13b": 4096,
     "ollama:llama2": 4096,
     "ollama:mistral": 32768,
-}
+})
 
-def get_model_token_limit(model_string):
-    for key, token_limit in MODEL_TOKEN_LIMITS.items():
-        if key in model_string:
-            return token_limit
-    return None
+def _build_token_limit_trie(model_token_limits: Mapping[str, int]) -> dict[str, dict]:
+    """Index token limits by provider, then by a character trie over the model name."""
+    trie = {}
+    for key, token_limit in model_token_limits.items():
+        provider, _, model = key.partition(":")
+        node = trie.setdefault(provider, {})
+        for char in model:
+            node = node.setdefault(char, {})
+        node[None] = token_limit
+    return trie
+
+_MODEL_TOKEN_LIMIT_TRIE = _build_token_limit_trie(MODEL_TOKEN_LIMITS)
+
+def _normalize_model_id(model_string: str) -> str:
+    """Canonical form of a provider-qualified model name for MODEL_TOKEN_LIMITS lookups."""
+    return model_string.strip().lower()
+
+@functools.lru_cache(maxsize=256)
+def get_model_token_limit(model_string: Optional[str]) -> Optional[int]:
+    """Token limit of the longest MODEL_TOKEN_LIMITS key that prefixes model_string, e.g. openai:gpt-4o-2024-08-06."""
+    if not model_string:
+        return None
+    model_string = _normalize_model_id(model_string)
+    # Most configured models are listed exactly; only dated or variant names need the prefix walk
+    token_limit = MODEL_TOKEN_LIMITS.get(model_string)
+    if token_limit is not None:
+        return token_limit
+    provider, _, model = model_string.partition(":")
+    node = _MODEL_TOKEN_LIMIT_TRIE.get(provider)
+    if node is None:
+        return None
+    token_limit = None
+    for char in model:
+        node = node.get(char)
+        if node is None:
+            break
+        token_limit = node.get(None, token_limit)
+    return token_limit
+
+@functools.lru_cache(maxsize=None)
+def _get_token_encoding(model_name: str):
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(model_name.split(":", 1)[-1])
+    except Exception:
+        # Not an OpenAI model, or tiktoken isn't available: fall back to the ~4 chars per token estimate
+        return None
+
+def count_tokens(text: str, model_name: str) -> int:
+    encoding = _get_token_encoding(model_name)
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+async def acount_tokens(texts: list[str], model_name: str) -> list[int]:
+    """Count tokens for each text in a worker thread, since loading the encoding and encoding large findings both block."""
+    return await asyncio.to_thread(lambda: [count_tokens(text, model_name) for text in texts])
+
+def select_notes_within_token_limit(notes: list[str], note_token_counts: list[int], token_limit: int) -> str:
+    """Join the longest prefix of whole notes that fits in token_limit, truncating only if not even the first note fits."""
+    total_tokens = 0
+    selected = 0
+    for token_count in note_token_counts:
+        if total_tokens + token_count > token_limit:
+            break
+        total_tokens += token_count
+        selected += 1
+    if selected == 0 and notes:
+        return notes[0][:token_limit * 4]
+    return "\n".join(notes[:selected])
 
 def remove_up_to_last_ai_message(messages: list[MessageLikeRepresentation]) -> list[MessageLikeRepresentation]:
     for i in range(len(messages) - 1, -1, -1):
@@ -808,12 +1329,144 @@ def remove_up_to_last_ai_message(messages: list[MessageLikeRepresentation]) -> l
             return messages[:i]  # Return everything up to (but not including) the last AI message
     return messages
 
+def prune_messages_to_token_limit(messages: list[MessageLikeRepresentation], token_limit: int) -> list[MessageLikeRepresentation]:
+    """Drop the oldest tool-calling turns until the messages fit in roughly token_limit tokens (~4 chars per token).
+
+    The system prompt, the opening human message and the trailing human message are always kept, and each
+    AI message is dropped together with its tool results so the remaining history stays valid.
+    """
+    char_budget = token_limit * 4
+    total_chars = sum(len(str(m.content)) for m in messages)
+    start = 2 if len(messages) > 1 and isinstance(messages[1], HumanMessage) else 1
+    end = len(messages) - 1 if messages and isinstance(messages[-1], HumanMessage) else len(messages)
+    cut = start
+    while total_chars > char_budget and cut < end:
+        total_chars -= len(str(messages[cut].content))
+        cut += 1
+        while cut < end and isinstance(messages[cut], ToolMessage):
+            total_chars -= len(str(messages[cut].content))
+            cut += 1
+    return messages[:start] + messages[cut:]
+
 ##########################
 # Misc Utils
 ##########################
-def get_today_str() -> str:
-    """Get current date in a human-readable format."""
-    return datetime.now().strftime("%a %b %-d, %Y")
+@functools.lru_cache(maxsize=32)
+def render_prompt(template: str, **kwargs) -> str:
+    """Format a static prompt template, reusing the rendered string for repeated arguments.
+
+    Only use this for templates whose arguments come from a small set (date, config values),
+    not for ones that embed messages or findings.
+    """
+    return template.format(**kwargs)
+
+@functools.lru_cache(maxsize=None)
+def _parse_prompt_template(template: str) -> tuple[tuple[str, Optional[str]], ...]:
+    return tuple((literal, field_name) for literal, field_name, _, _ in string.Formatter().parse(template))
+
+def fill_prompt(template: str, **kwargs) -> str:
+    """Equivalent to template.format(**kwargs) for plain {name} fields, but the template is only parsed once."""
+    parts = []
+    for literal, field_name in _parse_prompt_template(template):
+        parts.append(literal)
+        if field_name is not None:
+            parts.append(str(kwargs[field_name]))
+    return "".join(parts)
+
+GITHUB_REPO_URL_PATTERN = re.compile(r"https?://(?:www\.)?github\.com/[\w.-]+/[\w.-]+", re.IGNORECASE)
+
+def is_obvious_design_request(messages: list[MessageLikeRepresentation], min_length: int = 40) -> bool:
+    """Whether the latest user message already names a GitHub repository and says something about it."""
+    last_human = next((m for m in reversed(messages) if isinstance(m, HumanMessage)), None)
+    if last_human is None:
+        return False
+    content = str(last_human.content)
+    return len(content) > min_length and GITHUB_REPO_URL_PATTERN.search(content) is not None
+
+@functools.lru_cache(maxsize=256)
+def make_message(role: str, content: str, cache_control: bool = False, trailing_content: str = "") -> BaseMessage:
+    """Shared message instance for a stable prompt. Callers must not mutate the returned message.
+
+    With cache_control, the content is sent as a text block marked as an Anthropic prompt-cache breakpoint,
+    and trailing_content (if any) as a separate block after the breakpoint.
+    """
+    if cache_control:
+        message_content = [{"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}]
+        if trailing_content:
+            message_content.append({"type": "text", "text": trailing_content})
+    else:
+        message_content = f"{content}\n\n{trailing_content}" if trailing_content else content
+    if role == "system":
+        return SystemMessage(content=message_content)
+    if role == "human":
+        return HumanMessage(content=message_content)
+    raise ValueError(f"Unsupported message role: {role}")
+
+def system_prompt_message(content: str, model_name: str, runtime_context: str = "") -> BaseMessage:
+    """Stable system prompt for model_name, marked for prompt caching where the provider needs explicit markers.
+
+    runtime_context (date, limits) is appended after the cached prefix so it can change without invalidating it.
+    """
+    # OpenAI caches long shared prefixes automatically and rejects unknown content block keys
+    return make_message("system", content, cache_control=str(model_name).lower().startswith("anthropic:"), trailing_content=runtime_context)
+
+class PromptCacheUsage(BaseCallbackHandler):
+    """Tally input tokens read from and written to provider prompt caches.
+
+    Each call is also logged at DEBUG level with its prompt size, cache usage, time to first token (for streamed
+    calls) and total latency, so prompt and caching changes can be checked against real runs.
+    """
+
+    # Only touches local counters, so there's no need to hop to a thread for each callback
+    run_inline = True
+
+    def __init__(self):
+        self.input_tokens = 0
+        self.cache_read_input_tokens = 0
+        self.cache_creation_input_tokens = 0
+        self._calls: Dict[UUID, dict] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], *, run_id: UUID, **kwargs: Any) -> None:
+        prompt_bytes = sum(len(str(message.content).encode("utf-8")) for batch in messages for message in batch)
+        self._calls[run_id] = {"start": time.perf_counter(), "prompt_bytes": prompt_bytes, "first_token": None}
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        call = self._calls.get(run_id)
+        if call is not None and call["first_token"] is None:
+            call["first_token"] = time.perf_counter()
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._calls.pop(run_id, None)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        call = self._calls.pop(run_id, None)
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if not usage:
+                    continue
+                details = usage.get("input_token_details") or {}
+                cache_read = details.get("cache_read", 0) or 0
+                cache_creation = details.get("cache_creation", 0) or 0
+                self.input_tokens += usage.get("input_tokens", 0)
+                self.cache_read_input_tokens += cache_read
+                self.cache_creation_input_tokens += cache_creation
+                if call is not None:
+                    end = time.perf_counter()
+                    ttft = f"{call['first_token'] - call['start']:.2f}s" if call["first_token"] else "n/a"
+                    logging.debug(
+                        f"LLM call: {call['prompt_bytes']:,} prompt bytes, {usage.get('input_tokens', 0):,} input tokens "
+                        f"({cache_read:,} cache read, {cache_creation:,} cache write), first token {ttft}, total {end - call['start']:.2f}s"
+                    )
+
+    def summary(self) -> str:
+        if not self.input_tokens:
+            return "Prompt cache: no usage reported"
+        hit_rate = self.cache_read_input_tokens / self.input_tokens
+        return (f"Prompt cache: {self.cache_read_input_tokens:,} of {self.input_tokens:,} input tokens read from cache "
+                f"({hit_rate:.0%}), {self.cache_creation_input_tokens:,} written")
+
+prompt_cache_usage = PromptCacheUsage()
 
 def get_config_value(value):
     if value is None:
@@ -825,35 +1478,43 @@ def get_config_value(value):
     else:
         return value.value
 
-def get_api_key_for_model(model_name: str, config: RunnableConfig):
-    should_get_from_config = os.getenv("GET_API_KEYS_FROM_CONFIG", "false")
+# apiKeys entry / environment variable holding the API key for each model name prefix
+_PROVIDER_API_KEY_NAMES = (
+    (_OPENAI_PREFIXES, "OPENAI_API_KEY"),
+    (_ANTHROPIC_PREFIXES, "ANTHROPIC_API_KEY"),
+    (("google",), "GOOGLE_API_KEY"),
+)
+
+@functools.cache
+def _get_api_keys_from_config() -> bool:
+    """Read GET_API_KEYS_FROM_CONFIG once, lazily so a .env loaded at startup is still picked up."""
+    return os.getenv("GET_API_KEYS_FROM_CONFIG", "false").lower() == "true"
+
+@functools.lru_cache(maxsize=64)
+def _api_key_name_for_model(model_name: str) -> Optional[str]:
     model_name = model_name.lower()
-    if should_get_from_config.lower() == "true":
-        api_keys = config.get("configurable", {}).get("apiKeys", {})
-        if not api_keys:
-            return None
-        if model_name.startswith("openai:"):
-            return api_keys.get("OPENAI_API_KEY")
-        elif model_name.startswith("anthropic:"):
-            return api_keys.get("ANTHROPIC_API_KEY")
-        elif model_name.startswith("google"):
-            return api_keys.get("GOOGLE_API_KEY")
-        return None
-    else:
-        if model_name.startswith("openai:"): 
-            return os.getenv("OPENAI_API_KEY")
-        elif model_name.startswith("anthropic:"):
-            return os.getenv("ANTHROPIC_API_KEY")
-        elif model_name.startswith("google"):
-            return os.getenv("GOOGLE_API_KEY")
+    for prefixes, key_name in _PROVIDER_API_KEY_NAMES:
+        if model_name.startswith(prefixes):
+            return key_name
+    return None
+
+def _get_secret(key_name: Optional[str], config: RunnableConfig) -> Optional[str]:
+    """Look up a key in the config's apiKeys or the environment, depending on GET_API_KEYS_FROM_CONFIG."""
+    if key_name is None:
         return None
+    if _get_api_keys_from_config():
+        return (config.get("configurable", {}).get("apiKeys") or {}).get(key_name)
+    return os.getenv(key_name)
+
+def get_api_key_for_model(model_name: str, config: RunnableConfig):
+    return _get_secret(_api_key_name_for_model(model_name), config)
+
+def get_http_client_kwargs(model_name: str, config: RunnableConfig) -> dict:
+    """Get the shared async HTTP client from the config for models that accept one."""
+    http_client = config.get("configurable", {}).get("http_client")
+    if http_client is None or not model_name.lower().startswith(_OPENAI_PREFIXES):
+        return {}
+    return {"http_async_client": http_client}
 
 def get_github_token(config: RunnableConfig):
-    should_get_from_config = os.getenv("GET_API_KEYS_FROM_CONFIG", "false")
-    if should_get_from_config.lower() == "true":
-        api_keys = config.get("configurable", {}).get("apiKeys", {})
-        if not api_keys:
-            return None
-        return api_keys.get("GITHUB_TOKEN")
-    else:
-        return os.getenv("GITHUB_TOKEN")
\ No newline at end of file
+    return _get_secret("GITHUB_TOKEN", config)
\ No newline at end of file
@@ -0,0 +1,75 @@
+import pytest
+
+from open_deep_research.configuration import Configuration
+from open_deep_research.utils import MODEL_TOKEN_LIMITS, get_model_token_limit
+
+
+def substring_token_limit(model_string):
+    """The original lookup: the first MODEL_TOKEN_LIMITS key contained in model_string."""
+    for key, token_limit in MODEL_TOKEN_LIMITS.items():
+        if key in model_string:
+            return token_limit
+    return None
+
+
+# Configuration's default models, and run.py's defaults after qualify_model_name
+CALL_SITE_MODELS = [
+    Configuration().analysis_model,
+    Configuration().compression_model,
+    Configuration().final_design_doc_model,
+    "openai:gpt-4.1-mini",
+]
+
+DATED_MODELS = [
+    "openai:gpt-4o-2024-08-06",
+    "openai:gpt-4o-mini-2024-07-18",
+    "openai:gpt-4.1-2025-04-14",
+    "openai:o3-mini-2025-01-31",
+    "anthropic:claude-sonnet-4-20250514",
+    "anthropic:claude-3-5-haiku-20241022",
+    "anthropic:claude-3-7-sonnet-latest",
+]
+
+OLLAMA_MODELS = [
+    "ollama:llama2:70b",
+    "ollama:llama2:13b",
+    "ollama:llama2:7b",
+    "ollama:llama2",
+    "ollama:codellama:34b",
+    "ollama:mistral:latest",
+]
+
+UNKNOWN_MODELS = [
+    "openai:gpt-5",
+    "anthropic:claude-2",
+    "groq:llama-3.1-70b",
+    "gpt-4.1",
+    "",
+]
+
+
+@pytest.mark.parametrize("model", list(MODEL_TOKEN_LIMITS))
+def test_exact_names(model):
+    assert get_model_token_limit(model) == MODEL_TOKEN_LIMITS[model] == substring_token_limit(model)
+
+
+@pytest.mark.parametrize("model", CALL_SITE_MODELS + DATED_MODELS + OLLAMA_MODELS)
+def test_matches_original_lookup(model):
+    assert get_model_token_limit(model) is not None
+    assert get_model_token_limit(model) == substring_token_limit(model)
+
+
+@pytest.mark.parametrize("model", CALL_SITE_MODELS + DATED_MODELS + OLLAMA_MODELS)
+def test_mixed_case_names(model):
+    assert get_model_token_limit(model.upper()) == get_model_token_limit(model)
+    assert get_model_token_limit(f"  {model.title()} ") == get_model_token_limit(model)
+
+
+@pytest.mark.parametrize("model", UNKNOWN_MODELS)
+def test_unknown_names(model):
+    assert get_model_token_limit(model) is None
+    assert substring_token_limit(model) is None
+
+
+def test_none():
+    assert get_model_token_limit(None) is None
@@ -0,0 +1,55 @@
+import string
+from datetime import date
+
+import pytest
+
+from open_deep_research import prompts
+from open_deep_research.utils import get_today_str, render_prompt, system_prompt_message
+
+# Instruction prompts sent as the leading, cacheable system message
+STATIC_SYSTEM_PROMPTS = [
+    "clarify_with_user_instructions",
+    "transform_messages_into_design_query_prompt",
+    "lead_analyzer_prompt",
+    "repository_analysis_system_prompt",
+    "compress_analysis_system_prompt",
+    "final_design_doc_generation_prompt",
+]
+
+
+@pytest.mark.parametrize("name", STATIC_SYSTEM_PROMPTS)
+def test_static_system_prompt_has_no_format_fields(name):
+    fields = [field for _, field, _, _ in string.Formatter().parse(getattr(prompts, name)) if field is not None]
+    assert fields == []
+
+
+@pytest.mark.parametrize("name", STATIC_SYSTEM_PROMPTS)
+def test_static_system_prompt_contains_no_date(name):
+    prompt = getattr(prompts, name)
+    assert get_today_str() not in prompt
+    assert date.today().isoformat() not in prompt
+    assert str(date.today().year) not in prompt
+
+
+@pytest.mark.parametrize("name", STATIC_SYSTEM_PROMPTS)
+def test_static_system_prompt_contains_no_concurrency_limit(name):
+    assert "max_concurrent_analysis_units" not in getattr(prompts, name)
+
+
+@pytest.mark.parametrize("model", ["anthropic:claude-sonnet-4-20250514", "openai:gpt-4.1"])
+def test_system_prompt_prefix_is_independent_of_runtime_context(model):
+    first = system_prompt_message(
+        prompts.lead_analyzer_prompt,
+        model,
+        runtime_context=render_prompt(prompts.lead_analyzer_runtime_context, date="Mon Jan 1, 2024", max_concurrent_analysis_units=3),
+    )
+    second = system_prompt_message(
+        prompts.lead_analyzer_prompt,
+        model,
+        runtime_context=render_prompt(prompts.lead_analyzer_runtime_context, date="Tue Dec 31, 2030", max_concurrent_analysis_units=10),
+    )
+    if isinstance(first.content, list):
+        assert first.content[0] == second.content[0]
+    else:
+        assert first.content.startswith(prompts.lead_analyzer_prompt)
+        assert second.content.startswith(prompts.lead_analyzer_prompt)
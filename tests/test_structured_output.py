@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+from open_deep_research.state import ClarifyWithUser
+from open_deep_research.utils import ainvoke_structured
+
+VALID_ARGS = {"need_clarification": False, "question": "", "verification": "Starting the analysis."}
+
+
+class FakeModel:
+    """Returns the queued responses in order, recording the messages each call was made with."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def bind_tools(self, tools, tool_choice=None):
+        return RunnableLambda(self._respond)
+
+    def _respond(self, messages):
+        self.calls.append(list(messages))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def tool_call_response(args, call_id="call_1"):
+    return AIMessage(content="", tool_calls=[{"name": "ClarifyWithUser", "args": args, "id": call_id}])
+
+
+def assert_tool_calls_answered(messages):
+    """Every tool call sent back to the provider, valid or malformed, needs a matching tool result."""
+    answered = {message.tool_call_id for message in messages if isinstance(message, ToolMessage)}
+    for message in messages:
+        if isinstance(message, AIMessage):
+            for tool_call in [*message.tool_calls, *message.invalid_tool_calls]:
+                assert tool_call["id"] in answered
+
+
+def run(model, max_retries=3):
+    return asyncio.run(ainvoke_structured(model, ClarifyWithUser, [HumanMessage(content="hi")], max_retries=max_retries))
+
+
+def test_valid_response():
+    model = FakeModel(tool_call_response(VALID_ARGS))
+    assert run(model).verification == "Starting the analysis."
+    assert len(model.calls) == 1
+
+
+def test_invalid_arguments_are_answered_with_the_error():
+    model = FakeModel(tool_call_response({"need_clarification": True}), tool_call_response(VALID_ARGS, "call_2"))
+    assert run(model).need_clarification is False
+    retry_messages = model.calls[1]
+    assert isinstance(retry_messages[-1], ToolMessage)
+    assert retry_messages[-1].tool_call_id == "call_1"
+    assert_tool_calls_answered(retry_messages)
+
+
+def test_malformed_arguments_are_answered_with_the_error():
+    malformed = AIMessage(
+        content="",
+        invalid_tool_calls=[{"name": "ClarifyWithUser", "args": '{"need_clarification": tru', "id": "call_1", "error": "bad JSON", "type": "invalid_tool_call"}],
+    )
+    model = FakeModel(malformed, tool_call_response(VALID_ARGS, "call_2"))
+    assert run(model).need_clarification is False
+    retry_messages = model.calls[1]
+    assert_tool_calls_answered(retry_messages)
+    assert "bad JSON" in retry_messages[-1].content
+
+
+def test_malformed_arguments_without_ids_are_left_out():
+    malformed = AIMessage(
+        content="",
+        invalid_tool_calls=[{"name": "ClarifyWithUser", "args": "{", "id": None, "error": None, "type": "invalid_tool_call"}],
+    )
+    model = FakeModel(malformed, tool_call_response(VALID_ARGS))
+    assert run(model).need_clarification is False
+    retry_messages = model.calls[1]
+    assert malformed not in retry_messages
+    assert isinstance(retry_messages[-1], HumanMessage)
+
+
+def test_transient_errors_are_retried():
+    model = FakeModel(ConnectionError("reset"), tool_call_response(VALID_ARGS))
+    assert run(model).need_clarification is False
+
+
+def test_gives_up_after_max_retries():
+    model = FakeModel(*[tool_call_response({"need_clarification": True}, f"call_{i}") for i in range(3)])
+    with pytest.raises(ValueError):
+        run(model)
+    assert len(model.calls) == 3
+
+
+def test_non_positive_max_retries_still_makes_one_attempt():
+    model = FakeModel(tool_call_response(VALID_ARGS))
+    assert run(model, max_retries=0).need_clarification is False